@@ -13,7 +13,8 @@ setup(
         "pdfkit",
         "markdown2",
         "matplotlib",
-        "parmap"
+        "parmap",
+        "PyPDF2>=2.0"
     ],
     entry_points="""
         [console_scripts]
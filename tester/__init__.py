@@ -4,8 +4,10 @@ from tester.config import Config
 from tester.build.commands import build
 from tester.course.commands import course
 from tester.module.commands import module
+from tester.questions.commands import questions
 from tester.report.commands import report
 from tester.student.commands import student
+from tester.tests.commands import tests
 
 
 @click.group()
@@ -17,8 +19,10 @@ def cli(ctx):
 cli.add_command(build)
 cli.add_command(course)
 cli.add_command(module)
+cli.add_command(questions)
 cli.add_command(report)
 cli.add_command(student)
+cli.add_command(tests)
 
 
 if __name__ == "__main__":
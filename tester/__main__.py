@@ -0,0 +1,3 @@
+from tester import cli
+
+cli()
@@ -0,0 +1,319 @@
+"""Functions for building, selecting and grading from Python, without going through the CLI.
+
+Everything here returns structured results instead of reporting them, so scripts can run many
+operations against one loaded course in a single process. Building still shows its progress as it
+goes, printing the same status lines and progress bars as the CLI::
+
+    from tester import api
+
+    config = api.load_course("~/tester_data", "cs341")
+    plan = api.plan_build(config, "quiz5", max_question=40)
+    solution_path = api.prepare_build(config, plan.output_dir_name, plan.output_format,
+                                      plan.questions)
+    result = api.render_build(config, plan)
+    grades = api.grade_roster(config)
+"""
+import csv
+import math
+import os
+import shutil
+from collections import namedtuple
+
+from tester.build.pipeline import (MIN_FREE_MEMORY, RENDER_RETRIES, RENDER_TIMEOUT,
+                                   TestDirectoryExistsError,
+                                   build_asset_bundle, build_solution, build_solution_html,
+                                   get_stylesheet_href, get_test_directory_path, plan_tests,
+                                   render_tests, resume_from_checkpoint)
+from tester.build.optimize import optimize_pdf
+from tester.build.render import AdaptiveJobRunner, Checkpoint
+from tester.config import Config
+from tester.module.index import ModuleIndex
+from tester.student.model import Student
+
+PASS_MARKS = "1YyPp+"
+FAIL_MARKS = "0NnFf-"
+
+BuildPlan = namedtuple("BuildPlan", [
+    "output_dir_name",
+    "output_path",
+    "output_format",
+    "questions",
+    "students",
+    "test_data",  # Rendering arguments of each test, keyed by student ID
+    "manifest",  # Question numbers (and chosen options) of each test, keyed by student ID
+])
+BuildResult = namedtuple("BuildResult", [
+    "results",  # (student, test path) pairs of every test built
+    "failures",  # Error messages of tests that failed to render, keyed by student ID
+])
+GradeResult = namedtuple("GradeResult", [
+    "student",
+    "points",
+    "grade",
+    "answered_count",
+    "points_lost",  # Set of questions whose points were lost to missing homework
+    "missing_hw",  # (module ID, homework, questions lost) of each homework not submitted
+])
+
+
+def load_course(data_path: str = None, course_name: str = None) -> Config:
+    """Loads a course, defaulting to TESTER_DATA_DIR_PATH and its active course.
+    """
+    return Config(data_path, course_name)
+
+
+def get_questions(config: Config, max_question: int = None) -> dict:
+    """Returns the question pool, optionally limited to questions up to a number.
+    """
+    questions = config.get_questions()
+    if max_question:
+        questions = {k: v for k, v in questions.items() if k <= max_question}
+    return questions
+
+
+def plan_build(config: Config, output_dir_name: str, max_question: int = None,
+               max_questions: int = None, output_format: str = "pdf", students: dict = None,
+               questions: dict = None, dryrun: bool = False) -> BuildPlan:
+    """Selects each student's questions and options for a test, without rendering any tests.
+
+    A dry run only selects question numbers, which are recorded in the plan's manifest.
+    """
+    if students is None:
+        students = config.get_students()
+    if questions is None:
+        questions = get_questions(config, max_question)
+    output_path = None
+    stylesheet_href = None
+    if not dryrun:
+        output_path = get_test_directory_path(config, output_dir_name)
+        if output_format == "html":
+            stylesheet_href = get_stylesheet_href(config)
+    test_data, manifest = plan_tests(config, students, questions, max_questions, output_path,
+                                     output_dir_name, dryrun, output_format, stylesheet_href)
+    return BuildPlan(output_dir_name, output_path, output_format, questions, students, test_data,
+                     manifest)
+
+
+def prepare_build(config: Config, output_dir_name: str, output_format: str = "pdf",
+                  questions: dict = None, force: bool = False, resume: bool = False,
+                  solution_only: bool = False) -> str:
+    """Creates a test directory and builds its solution, returning the solution's path.
+
+    An existing test directory is kept when resuming and replaced when forced. Otherwise only its
+    solution is rebuilt, after which TestDirectoryExistsError is raised unless `solution_only`.
+    """
+    if questions is None:
+        questions = get_questions(config)
+    output_path = get_test_directory_path(config, output_dir_name)
+    test_directory_exists = False
+    if os.path.exists(output_path):
+        if resume:
+            pass  # Keep everything built so far
+        elif not force:
+            test_directory_exists = True
+        else:
+            shutil.rmtree(output_path)
+    os.makedirs(output_path, exist_ok=True)
+
+    if output_format == "html":
+        stylesheet_href = build_asset_bundle(config, output_path)
+        solution_path = os.path.join(output_path, config.solution_html_file_name)
+        build_solution_html(config, solution_path, questions, stylesheet_href)
+    else:
+        solution_path = os.path.join(output_path, config.solution_file_name)
+        if not (resume and os.path.exists(solution_path)):
+            build_solution(config, solution_path, questions)
+    if test_directory_exists and not solution_only:
+        msg = "That test directory already exists.  Make a new one or delete the existing one."
+        raise TestDirectoryExistsError(msg)
+    return solution_path
+
+
+def render_build(config: Config, plan: BuildPlan, resume: bool = False, jobs: int = None,
+                 timeout: float = RENDER_TIMEOUT, retries: int = RENDER_RETRIES,
+                 min_free_memory: int = MIN_FREE_MEMORY) -> BuildResult:
+    """Renders the tests of a plan into its prepared test directory and saves its manifest.
+
+    Up to `jobs` tests render at once, fewer while less than `min_free_memory` megabytes are free
+    or the CPUs are overloaded. When resuming, tests recorded in the directory's checkpoint are
+    kept if their assignments haven't changed.
+    """
+    test_data = plan.test_data
+    checkpoint = Checkpoint(os.path.join(plan.output_path, config.checkpoint_file_name))
+    completed = {}
+    if resume:
+        completed = checkpoint.load()
+        previous_manifest = {}
+        if os.path.exists(os.path.join(plan.output_path, config.manifest_file_name)):
+            previous_manifest = config.get_manifest(plan.output_dir_name)
+        test_data = resume_from_checkpoint(test_data, plan.manifest, previous_manifest, completed)
+    config.save_manifest(plan.output_dir_name, plan.manifest)
+    runner = AdaptiveJobRunner(processes=jobs, timeout=timeout, retries=retries,
+                               min_free_memory=min_free_memory * 1024 * 1024)
+    results, failures = render_tests(test_data, plan.output_format, runner, checkpoint)
+    results += [
+        (plan.students[sid], path) for sid, path in completed.items() if sid in plan.manifest
+    ]
+    return BuildResult(results, failures)
+
+
+def optimize_build(paths: dict, quality: str = "ebook", jobs: int = None,
+                   min_free_memory: int = MIN_FREE_MEMORY) -> tuple:
+    """Shrinks built PDFs in parallel, given as a dictionary of keys to paths.
+
+    Returns the sizes of each file before and after, and the error messages of files that could
+    not be optimized, both keyed like the paths.
+    """
+    runner = AdaptiveJobRunner(processes=jobs, timeout=RENDER_TIMEOUT,
+                               min_free_memory=min_free_memory * 1024 * 1024)
+    return runner.run(optimize_pdf, {key: (path, quality) for key, path in paths.items()})
+
+
+def grade_student(student: Student, module_index: ModuleIndex,
+                  question_limit: int) -> GradeResult:
+    """Grades a student, removing points of answered questions in modules with missing homework.
+    """
+    points_removed = set()
+    missing_hw = []
+    student_answered = student.all_answered
+    for m_id, module_questions in module_index.module_questions.items():
+        q_count = len(module_questions)
+        hw_count = len(module_index.module_hw[m_id])
+        # Students who did the HW get any test question points they have
+        for hwork in module_index.missing_hw(m_id, student.hw):
+            max_questions_to_remove = math.ceil(q_count / hw_count)
+            questions_lost = []
+            for i in module_questions:
+                if i in student_answered and i not in points_removed:
+                    points_removed.add(i)
+                    questions_lost.append(i)
+                if len(questions_lost) >= max_questions_to_remove:
+                    break
+            missing_hw.append((m_id, hwork, questions_lost))
+
+    answered_count = sum(
+        1 for q in student.iter_answered()
+        if q in module_index.all_questions and q not in points_removed
+    )
+    points = answered_count + student.bonus - student.penalty
+    points = points if points <= question_limit else question_limit
+    grade = points / question_limit * 100
+    grade = min(max(grade, 0.0), 100.0)
+    return GradeResult(student, points, grade, answered_count, points_removed, missing_hw)
+
+
+def grade_roster(config: Config, question_limit: int = None, as_of: str = None,
+                 students: dict = None) -> list:
+    """Grades every student of a course, sorted by last name.
+
+    The question limit defaults to the number of questions across all modules.
+    """
+    module_index = config.get_module_index()
+    if students is None:
+        students = config.get_students(as_of=as_of)
+    if not question_limit:
+        question_limit = module_index.question_limit
+    return [
+        grade_student(s, module_index, question_limit)
+        for s in sorted(students.values(), key=lambda k: k.last_name)
+    ]
+
+
+def import_students(config: Config, path_to_csv_file: str, students: dict = None) -> dict:
+    """Imports students from a CSV file, updating any existing ones, and saves them.
+
+    Returns all students of the course.
+    """
+    id_key = "id"
+    if students is None:
+        students = config.get_students()
+    with open(path_to_csv_file, "r", encoding="utf-8-sig") as csvfile:
+        # TODO: validate CSV format
+        reader = csv.reader(csvfile, delimiter=",")
+        headers = list(next(reader, None))
+        headers = [h.lower().strip() for h in headers]
+        headers = [h.replace(" ", "_") for h in headers]
+        for row in reader:
+            new_student = {}
+            for i, h in enumerate(headers):
+                new_student[h] = row[i].strip()
+
+            if new_student[id_key] in students:
+                students[new_student[id_key]].update(new_student)
+            else:  # Any keys missing from the CSV take the student defaults
+                students[new_student[id_key]] = Student.from_dict(new_student)
+
+    config.save_students(students, op="import")
+    return students
+
+
+def apply_answered_csv(config: Config, name: str, path_to_csv_file: str,
+                       students: dict = None) -> dict:
+    """Adds the answered questions listed in a CSV file to the named quiz, and saves them.
+
+    Returns all students of the course.
+    """
+    if students is None:
+        students = config.get_students()
+    with open(path_to_csv_file, "r", encoding="utf-8-sig") as csvfile:
+        reader = csv.reader(csvfile, delimiter=",")
+        headers = next(reader, None)
+        for row in reader:
+            row_dict = {}
+            for i, col in enumerate(headers):
+                row_dict[col] = row[i]
+
+            if not row_dict["answered"]:
+                continue
+
+            sid = row_dict["id"]
+            answered = map(int, row_dict["answered"].split())
+            students[sid].add_answered(name, answered)
+    config.save_students(students, op="update", quiz=name)
+    return students
+
+
+def apply_results(config: Config, name: str, path_to_results_file: str,
+                  students: dict = None) -> list:
+    """Adds the questions passed on a built test, read from a file of graded results.
+
+    Returns the IDs of the students who passed at least one question.
+    """
+    manifest = config.get_manifest(name)
+    if students is None:
+        students = config.get_students()
+    updated = []
+    with open(path_to_results_file, "r", encoding="utf-8-sig") as csvfile:
+        reader = csv.reader(csvfile, delimiter=",")
+        for row in reader:
+            row = [c.strip() for c in row if c.strip()]
+            if not row or row[0].lower() == "id":
+                continue
+            sid, marks = row[0], "".join(row[1:]).replace(" ", "")
+            if sid not in manifest:
+                raise UnknownStudentResultError(f"Student '{sid}' did not receive test '{name}'.")
+            assigned = manifest[sid]["questions"]
+            if len(marks) != len(assigned):
+                raise InvalidResultsError(
+                    f"Student '{sid}' has {len(marks)} marks for {len(assigned)} questions."
+                )
+            passed = set()
+            for q_num, mark in zip(assigned, marks):
+                if mark in PASS_MARKS:
+                    passed.add(q_num)
+                elif mark not in FAIL_MARKS:
+                    raise InvalidResultsError(f"Unrecognized mark '{mark}' for student '{sid}'.")
+            if not passed:
+                continue
+            students[sid].add_answered(name, passed)
+            updated.append(sid)
+    config.save_students(students, op="record", quiz=name)
+    return updated
+
+
+class UnknownStudentResultError(Exception):
+    pass
+
+
+class InvalidResultsError(Exception):
+    pass
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+
+MATH_PATTERN = re.compile(r"\$\$(.+?)\$\$", re.DOTALL)
+DIAGRAM_PATTERN = re.compile(r"^```dot[ \t]*\n(.*?)^```[ \t]*$", re.DOTALL | re.MULTILINE)
+# Fenced code blocks and inline code spans, whose contents are never math
+CODE_PATTERN = re.compile(r"^(```|~~~).*?^\1[ \t]*$|(`+).+?\2", re.DOTALL | re.MULTILINE)
+DIAGRAM_TIMEOUT = 60  # seconds
+MATH_DPI = 120
+
+
+def render_math(source: str) -> bytes:
+    """Renders a TeX math expression to SVG with matplotlib's mathtext.
+    """
+    from matplotlib.mathtext import math_to_image
+    svg = io.BytesIO()
+    math_to_image("${}$".format(" ".join(source.split())), svg, dpi=MATH_DPI, format="svg")
+    return svg.getvalue()
+
+
+def render_diagram(source: str) -> bytes:
+    """Renders a Graphviz diagram to SVG with the `dot` command.
+    """
+    result = subprocess.run(["dot", "-Tsvg"], input=source.encode(), capture_output=True,
+                            timeout=DIAGRAM_TIMEOUT)
+    if result.returncode != 0:
+        raise ValueError(result.stderr.decode().strip())
+    return result.stdout
+
+
+class AssetCache():
+    """Math and diagram blocks of question markdown, pre-rendered to SVG once per content.
+
+    Display math (`$$...$$`) outside of code and ```dot fenced diagrams are replaced with images of
+    their SVG, which is stored in the cache under a hash of its source. Images reference the cache
+    directly, unless an asset directory is given, e.g. for HTML output, in which case the SVGs are
+    copied there and referenced relative to the document. Blocks that fail to render are left as
+    is.
+    """
+    def __init__(self, cache_path: str, assets_path: str = None, assets_href: str = None):
+        self.cache_path = cache_path
+        self.assets_path = assets_path
+        self.assets_href = assets_href
+        self.failed = set()
+
+    def get_asset(self, kind: str, source: str, render) -> str:
+        """Returns the file name of a block's SVG, rendering it if it isn't cached yet.
+        """
+        digest = hashlib.sha256(f"{kind}\0{source}".encode()).hexdigest()
+        file_name = f"{kind}-{digest[:20]}.svg"
+        asset_path = os.path.join(self.cache_path, file_name)
+        if not os.path.exists(asset_path):
+            os.makedirs(self.cache_path, exist_ok=True)
+            svg = render(source)
+            partial_path = f"{asset_path}.{os.getpid()}.part"
+            with open(partial_path, "wb") as fout:
+                fout.write(svg)
+            os.replace(partial_path, asset_path)
+        if self.assets_path and not os.path.exists(os.path.join(self.assets_path, file_name)):
+            os.makedirs(self.assets_path, exist_ok=True)
+            shutil.copyfile(asset_path, os.path.join(self.assets_path, file_name))
+        return file_name
+
+    def _replace(self, match, kind: str, render) -> str:
+        source = match.group(1)
+        if (kind, source) in self.failed:
+            return match.group(0)
+        try:
+            file_name = self.get_asset(kind, source, render)
+        except Exception as e:  # Keep the source when a renderer is missing or fails
+            self.failed.add((kind, source))
+            print(f"! Could not pre-render {kind} block, leaving it as is: {e}")
+            return match.group(0)
+        if self.assets_path:
+            src = f"{self.assets_href}{file_name}"
+        else:
+            src = "file://" + os.path.join(os.path.abspath(self.cache_path), file_name)
+        return f"<img class=\"{kind}\" src=\"{src}\">"
+
+    def preprocess(self, content: str) -> str:
+        """Replaces the math and diagram blocks of markdown content with pre-rendered images.
+        """
+        if "```dot" in content:
+            content = DIAGRAM_PATTERN.sub(lambda m: self._replace(m, "diagram", render_diagram),
+                                          content)
+        if "$$" in content:
+            content = self._replace_math(content)
+        return content
+
+    def _replace_math(self, content: str) -> str:
+        """Replaces the math blocks of markdown content, skipping code blocks and spans.
+        """
+        parts = []
+        start = 0
+        for code in CODE_PATTERN.finditer(content):
+            parts.append(MATH_PATTERN.sub(lambda m: self._replace(m, "math", render_math),
+                                          content[start:code.start()]))
+            parts.append(code.group(0))
+            start = code.end()
+        parts.append(MATH_PATTERN.sub(lambda m: self._replace(m, "math", render_math),
+                                      content[start:]))
+        return "".join(parts)
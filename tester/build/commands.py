@@ -1,106 +1,238 @@
+import json
 import os
 import random
-import shutil
-import smtplib
-from getpass import getpass
-from email.message import EmailMessage
+import subprocess
+import sys
+import time
 
 import click
-import parmap
-import pdfkit
 import tqdm
-from markdown2 import markdown
 
+from tester.api import get_questions, optimize_build, plan_build, prepare_build, render_build
+from tester.build.optimize import PDF_QUALITIES
+from tester.build.pipeline import (MIN_FREE_MEMORY, RENDER_RETRIES, RENDER_TIMEOUT,
+                                   build_asset_bundle, build_solution, build_solution_html,
+                                   build_test, get_asset_cache, get_next_questions,
+                                   get_test_directory_path, plan_tests, render_tests,
+                                   resume_from_checkpoint)
+from tester.build.render import AdaptiveJobRunner, Checkpoint
+from tester.build.shard import (CLAIM_LEASE, WorkQueue, get_part_path, in_shard,
+                                merge_shard_outputs, parse_shard, shard_name, start_shard_log,
+                                write_shard_log)
+from tester.build.template import TestTemplate
+from tester.build.watch import get_watched_paths, snapshot_mtimes, wait_for_changes
 from tester.config import Config
+from tester.mail import get_email, send_emails
+from tester.student.model import Student
 
-MAX_LINES = 55
 
+def _build_preview(config: Config, output_path: str, max_question: int, output_format: str,
+                   sample_student: Student = None):
+    """Rebuilds the solution, and optionally one student's test, into a preview directory.
+    """
+    questions = get_questions(config, max_question)
+    if output_format == "html":
+        stylesheet_href = build_asset_bundle(config, output_path)
+        solution_path = os.path.join(output_path, config.solution_html_file_name)
+        build_solution_html(config, solution_path, questions, stylesheet_href)
+    else:
+        stylesheet_href = None
+        solution_path = os.path.join(output_path, config.solution_file_name)
+        build_solution(config, solution_path, questions)
+    print(f": Solution preview written to '{solution_path}'")
+
+    if sample_student:
+        selected_questions = get_next_questions(
+            sample_student,
+            questions,
+            sample_student.max_questions
+        )
+        # Seeded so saving a file does not reshuffle the sample's options
+        rng = random.Random(sample_student.id)
+        selected_options = [(q["num"], rng.choice(sorted(q["options"])))
+                            for q in selected_questions]
+        assets = get_asset_cache(config, output_path if output_format == "html" else None)
+        template = TestTemplate.from_config(config, preprocess=assets.preprocess)
+        test_content = template.render(sample_student, selected_options)
+        _, test_path = build_test(config, output_path, None, sample_student, test_content,
+                                  False, output_format, stylesheet_href)
+        print(f": Sample test preview written to '{test_path}'")
 
-def _get_next_questions(student: dict, questions: dict, max_questions: int):
-    """Obtains the next set of questions for the given student and question pool.
+
+def _watch(config: Config, output_dir_name: str, max_question: int, output_format: str,
+           sample_sid: str, interval: float):
+    """Rebuilds the preview of a test whenever the question pool or headers change.
+
+    Previews are written to the preview cache, never over a built test directory.
     """
-    sorted_question_keys = sorted(questions.keys())
-    selected_questions = []
-    questions_added = 0
-    answered_questions = [q for sublist in student["answered"].values() for q in sublist]
-    for q_num in sorted_question_keys:
-        already_answered = q_num in answered_questions
-        cant_answer = q_num in student["disallowed"]
-        if already_answered or cant_answer:
-            continue
-        selected_questions.append(questions[q_num])
-        questions_added += 1
-        if questions_added >= max_questions:
-            break
+    output_path = os.path.join(config.cache_dir_path, config.preview_cache_dir_name,
+                               output_dir_name)
+    sample_student = None
+    if sample_sid:
+        sample_student = config.get_students().get(sample_sid)
+        if sample_student is None:
+            raise click.BadParameter(f"No student with ID '{sample_sid}' in the active course.",
+                                     param_hint="'--sample-sid'")
+    os.makedirs(output_path, exist_ok=True)
+    watched_paths = get_watched_paths(config)
+    mtimes = snapshot_mtimes(watched_paths)
+    print(f": Watching for changes every {interval}s, press Ctrl+C to stop...")
+    try:
+        while True:
+            try:
+                _build_preview(config, output_path, max_question, output_format, sample_student)
+            except Exception as e:  # Keep watching while files are mid-edit
+                print(f"! Preview failed: {e}")
+            mtimes, changed = wait_for_changes(watched_paths, mtimes, interval)
+            for path in changed:
+                print(f": Changed: {os.path.relpath(path, config.active_course_path)}")
+    except KeyboardInterrupt:
+        print(": Stopped watching.")
 
-    return selected_questions
+
+def _print_failures(failures: dict, output_dir_name: str):
+    """Summarizes the tests that could not be rendered.
+    """
+    if not failures:
+        return
+    print(f"! {len(failures)} tests failed to build:")
+    for sid, error in sorted(failures.items()):
+        print(f"!   {sid}: {error}")
+    print(f"! Run 'tester build {output_dir_name} --resume' to retry only these.")
 
 
-def _build_test(config: Config, output_path: str, output_dir_name: str, student: dict,
-                all_question_content: str, dryrun: bool) -> tuple:
-    """Generates a single test for the given information.
+def _print_optimization(sizes: dict, paths: dict):
+    """Reports how much each optimized PDF shrank.
     """
-    output_file_name = "{}_{}.{}".format(student["last_name"], student["id"], config.test_file_ext)
-    test_output_path = os.path.join(output_path, output_file_name)
-    if not dryrun:
-        test_header_content = ""
-        with open(config.test_header_path, "r") as fin:
-            test_header_content = fin.read()
-        test_content = ""
-        test_content += "{}\n\n".format(test_header_content, output_dir_name)
-        test_content += "**Name: {0} {1} (ID: {2}) (Section: {3})**\n\n".format(
-            student["first_name"],
-            student["last_name"],
-            student["id"],
-            student["section"]
-        )
-        test_content += all_question_content
-        html_text = markdown(test_content, extras=["tables"])
-        html_text = "<html><body style=\"\">" + html_text + "</body></html>"
-        pdfkit.from_string(
-            html_text,
-            test_output_path,
-            options=config.pdf_options,
-            css=config.custom_css_file_path
-        )
-    return (student, test_output_path)
+    for key, (size_before, size_after) in sorted(sizes.items()):
+        reduction = 1 - size_after / size_before if size_before else 0
+        print(f"  {os.path.basename(paths[key])}: {size_before} -> {size_after} bytes "
+              f"({reduction:.0%} smaller)")
+    total_before = sum(before for before, _ in sizes.values())
+    total_after = sum(after for _, after in sizes.values())
+    if total_before:
+        print(f": Optimized {len(sizes)} PDFs from {total_before} to {total_after} bytes "
+              f"({1 - total_after / total_before:.0%} smaller).")
 
 
-def _build_solution(config: Config, solution_path, questions):
-    """Generates a single file with all questions and answers.
+def _build_shard(config: Config, output_dir_name: str, shard_num: int, shard_count: int,
+                 max_question: int = None, max_questions: int = None, output_format: str = "pdf",
+                 jobs: int = None, timeout: float = RENDER_TIMEOUT, retries: int = RENDER_RETRIES,
+                 min_free_memory: int = MIN_FREE_MEMORY, merge: bool = True):
+    """Builds the tests of one shard of the students into an existing test directory.
+
+    Shards always resume from their checkpoint, so a shard that is run again only builds the
+    tests it is missing. Unless `merge` is off, e.g. for workers of a coordinated build, the shard
+    that finishes last merges the outputs of every shard.
     """
-    sorted_question_keys = sorted(questions.keys())
-    solution_content = ""
-    with open(config.solution_header_path, "r") as fin:
-        solution_content += fin.read()
+    part = shard_name(shard_num, shard_count)
+    output_path = get_test_directory_path(config, output_dir_name)
+    os.makedirs(output_path, exist_ok=True)
+    print(f": Building shard {part} of '{output_dir_name}'")
+
+    students = {
+        sid: s for sid, s in config.get_students().items()
+        if in_shard(sid, shard_num, shard_count)
+    }
+    questions = get_questions(config, max_question)
+    stylesheet_href = build_asset_bundle(config, output_path) if output_format == "html" else None
+
+    all_test_data, manifest = plan_tests(config, students, questions, max_questions, output_path,
+                                         output_dir_name, False, output_format, stylesheet_href)
+    checkpoint = Checkpoint(get_part_path(os.path.join(output_path, config.checkpoint_file_name),
+                                          part))
+    manifest_part_path = get_part_path(os.path.join(output_path, config.manifest_file_name), part)
+    previous_manifest = {}
+    if os.path.exists(manifest_part_path):
+        with open(manifest_part_path, "r") as fin:
+            previous_manifest = json.load(fin)
+    completed = checkpoint.load()
+    all_test_data = resume_from_checkpoint(all_test_data, manifest, previous_manifest, completed)
+    start_shard_log(config, output_path, part)
+    config.save_manifest(output_dir_name, manifest, part=part)
 
-    for q_num in sorted_question_keys:
-        sorted_question_options = sorted(questions[q_num]["options"])
-        for o_num, option in enumerate(sorted_question_options, start=1):
-            question_content = None
-            answer_content = None
-            with open(option, "r") as fin:
-                question_content = [x.strip("<br/>") for x in fin.readlines()]
-            answer_filename, answer_file_ext = os.path.splitext(option)
-            answer_filename = f"{answer_filename}.solution{answer_file_ext}"
-            with open(answer_filename, "r") as fin:
-                answer_content = [x for x in fin.readlines()]
+    runner = AdaptiveJobRunner(processes=jobs, timeout=timeout, retries=retries,
+                               min_free_memory=min_free_memory * 1024 * 1024)
+    results, failures = render_tests(all_test_data, output_format, runner, checkpoint)
+    results += [(students[sid], path) for sid, path in completed.items() if sid in students]
+    write_shard_log(config, output_path, part, results)
+    _print_failures(failures, output_dir_name)
+    if merge and merge_shard_outputs(config, output_path, shard_count):
+        print(f": All {shard_count} shards of '{output_dir_name}' are built and merged.")
 
-            if question_content and answer_content:
-                solution_content += "## Question {}.{}\n\n".format(q_num, o_num)
-                solution_content += "".join(question_content)
 
-                solution_content += "#### Answer {}.{}\n\n".format(q_num, o_num)
-                solution_content += "".join(answer_content)
+def _run_worker(config: Config, output_dir_name: str):
+    """Builds shards claimed from a test directory's work queue until none remain.
+
+    The coordinator that queued them merges their outputs once every shard is done.
+    """
+    output_path = get_test_directory_path(config, output_dir_name)
+    queue = WorkQueue(os.path.join(output_path, config.queue_dir_name))
+    if not queue.exists():
+        print(f": No work queue found for '{output_dir_name}'.")
+        return
+    claimed = queue.claim()
+    while claimed:
+        name, task = claimed
+        with queue.keep_claimed(name):
+            _build_shard(config, output_dir_name, merge=False, **task)
+        queue.complete(name)
+        claimed = queue.claim()
+    print(": No shards left to build.")
 
-    html_text = markdown(solution_content, extras=["tables"])
-    html_text = "<html><body style=\"\">" + html_text + "</body></html>"
-    pdfkit.from_string(
-        html_text,
-        solution_path,
-        options=config.pdf_options,
-        css=config.custom_css_file_path
-    )
+
+def _coordinate_shards(config: Config, output_path: str, output_dir_name: str, shard_count: int,
+                       local_workers: int, max_question: int, max_questions: int,
+                       output_format: str, jobs: int, timeout: float, retries: int,
+                       min_free_memory: int):
+    """Queues every shard of a build, optionally starting local workers, and waits for them.
+    """
+    queue = WorkQueue(os.path.join(output_path, config.queue_dir_name))
+    queue.create({
+        shard_name(i, shard_count): {
+            "shard_num": i,
+            "shard_count": shard_count,
+            "max_question": max_question,
+            "max_questions": max_questions,
+            "output_format": output_format,
+            "jobs": jobs,
+            "timeout": timeout,
+            "retries": retries,
+            "min_free_memory": min_free_memory
+        } for i in range(1, shard_count + 1)
+    })
+    worker_args = [sys.executable, "-m", "tester", "build", output_dir_name, "--worker"]
+    workers = [subprocess.Popen(worker_args) for _ in range(local_workers)]
+    print(f": Queued {shard_count} shards; run 'tester build {output_dir_name} --worker' "
+          "on any machine sharing this data directory to help.")
+    last_counts = None
+    while True:
+        counts = queue.counts()
+        if counts != last_counts:
+            print(": Shards pending: {}, in progress: {}, done: {}".format(*counts))
+            last_counts = counts
+        if counts[2] >= shard_count:
+            break
+        stale = queue.stale_claims(CLAIM_LEASE)
+        workers_alive = any(w.poll() is None for w in workers)
+        if not workers_alive and stale and len(stale) == counts[1]:
+            remaining = sorted(os.listdir(queue.pending_path)) + stale
+            raise ShardedBuildError(
+                f"Workers stopped renewing their claims with {len(remaining)} shards left; run "
+                f"'tester build {output_dir_name} --shard i/N' for each of "
+                f"{', '.join(name.replace('-of-', '/') for name in remaining)} to finish them."
+            )
+        for name in stale:
+            print(f"! Shard '{name}' lost its worker; queueing it again.")
+            queue.requeue(name)
+        if workers and not workers_alive and not counts[1]:
+            raise ShardedBuildError(f"Workers exited with {shard_count - counts[2]} shards left.")
+        time.sleep(1)
+    for worker in workers:
+        worker.wait()
+    merge_shard_outputs(config, output_path, shard_count)
+    queue.remove()
+    print(f": All {shard_count} shards of '{output_dir_name}' are built and merged.")
 
 
 @click.command()
@@ -117,95 +249,95 @@ def _build_solution(config: Config, solution_path, questions):
               help="The maximum number of questions that may appear on a test.")
 @click.option("--email", is_flag=True, default=False,
               help="Send each student their test via email immediately after the build.")
+@click.option("--format", "output_format", default="pdf", type=click.Choice(["pdf", "html"]),
+              help="Render PDFs, or HTML files sharing one stylesheet without running wkhtmltopdf.")
+@click.option("--watch", is_flag=True, default=False,
+              help="Keep re-rendering a preview of the solution as questions change.")
+@click.option("--sample-sid", default=None,
+              help="With --watch, also re-render the test of the student with this ID.")
+@click.option("--interval", default=0.5, type=float,
+              help="With --watch, the number of seconds between checks for changes.")
+@click.option("--shard", default=None,
+              help="Only build the tests of shard i of N (given as 'i/N') of the students.")
+@click.option("--shards", default=None, type=int,
+              help="Queue the build as this many shards for workers and wait for them to finish.")
+@click.option("--local-workers", default=0, type=int,
+              help="With --shards, the number of workers to start on this machine.")
+@click.option("--worker", is_flag=True, default=False,
+              help="Build shards from the test directory's work queue until none remain.")
+@click.option("--resume", is_flag=True, default=False,
+              help="Continue an interrupted build, only building tests that are failed or missing.")
+@click.option("--jobs", default=None, type=int,
+              help="The most tests to render at once (defaults to the number of CPUs).")
+@click.option("--min-free-memory", default=MIN_FREE_MEMORY, type=int,
+              help="Start no more renders while fewer than this many megabytes are free.")
+@click.option("--optimize", is_flag=True, default=False,
+              help="Shrink the built PDFs, e.g. before emailing them.")
+@click.option("--optimize-quality", default="ebook", type=click.Choice(PDF_QUALITIES),
+              help="With --optimize, the image quality to downsample to.")
+@click.option("--timeout", default=RENDER_TIMEOUT, type=float,
+              help="The number of seconds a single test may take to render.")
+@click.option("--retries", default=RENDER_RETRIES, type=int,
+              help="The number of times to retry rendering a test that failed.")
 @click.pass_obj
 def build(config: Config, output_dir_name: str, dryrun: bool, force: bool, solution_only: bool,
-          max_question: int, max_questions: int, email: str):
+          max_question: int, max_questions: int, email: str, output_format: str, watch: bool,
+          sample_sid: str, interval: float, shard: str, shards: int, local_workers: int,
+          worker: bool, resume: bool, jobs: int, min_free_memory: int, optimize: bool,
+          optimize_quality: str, timeout: float, retries: int):
     """Build tests for the active course.
     """
-    test_directory_exists = False
-    if not dryrun:
-        output_path = os.path.join(
-            config.active_course_path,
-            config.tests_dir_name,
-            output_dir_name
-        )
-        if os.path.exists(output_path):
-            if not force:
-                test_directory_exists = True
-            else:
-                shutil.rmtree(output_path)
-        if not test_directory_exists:
-            os.mkdir(output_path)
-
-    students = config.get_students()
-    questions = config.get_questions()
-    if max_question:
-        questions = {k: v for k, v in questions.items() if k <= max_question}
+    if watch:
+        _watch(config, output_dir_name, max_question, output_format, sample_sid, interval)
+        return
+    if worker:
+        _run_worker(config, output_dir_name)
+        return
+    if shard:
+        shard_num, shard_count = parse_shard(shard)
+        _build_shard(config, output_dir_name, shard_num, shard_count, max_question,
+                     max_questions, output_format, jobs, timeout, retries, min_free_memory)
+        return
+    if shards and (email or dryrun):
+        raise ShardedBuildError("Sharded builds can't be combined with --email or --dryrun.")
 
-    if not dryrun:
-        solution_path = os.path.join(output_path, config.solution_file_name)
-        _build_solution(config, solution_path, questions)
-        if solution_only:
-            return
-        elif test_directory_exists:
-            msg = "That test directory already exists.  Make a new one or delete the existing one."
-            raise TestDirectoryExistsError(msg)
-
-    all_test_data = []
-    print("Acquiring test data...")
-    for sid, student in tqdm.tqdm(students.items()):
-        max_questions = student["max_questions"] if not max_questions else int(max_questions)
-        selected_questions = _get_next_questions(student, questions, max_questions)
-        if not selected_questions:
-            print("! Student {} has no questions; no test will be generated.".format(sid))
-            continue  # If the student has no questions, print a message and skip them
-
-        if dryrun:  # Just print the question numbers if we're doing a dry run.
+    if dryrun:  # Just print the question numbers if we're doing a dry run.
+        plan = plan_build(config, output_dir_name, max_question, max_questions, dryrun=True)
+        for sid, assignment in plan.manifest.items():
             print(sid, ":", sep="", end="")
-            for question in selected_questions:
-                print("", question["num"], end="")
+            for q_num in assignment["questions"]:
+                print("", q_num, end="")
             print()
+        return
 
-        all_question_content = ""
-        if not dryrun:
-            line_count = 0
-            for question in selected_questions:
-                selected_option_path = random.choice(question["options"])
-                question_content = None
-                with open(selected_option_path, "r") as fin:
-                    question_content = [x for x in fin.readlines()]
-                lines_added = len(question_content)
-                line_count += lines_added
-                for line in question_content:
-                    # adding an extra line for each table row
-                    if line.startswith("|") and not line.startswith("|-"):
-                        lines_added += 1
-                        line_count += 1
-                if line_count > MAX_LINES:
-                    all_question_content += "<p class='keep-together break-after'><p>\n"
-                    line_count = lines_added
-                assert question_content, "Question at '{}' has no content".format(
-                    selected_option_path
-                )
-                all_question_content += "**{}.** ".format(question["num"])  # TODO: include option #
-                for line in question_content:
-                    all_question_content += line
-
-        test_data = (config, output_path, output_dir_name, student, all_question_content, dryrun)
-        all_test_data.append(test_data)
-        # TODO: generate a log file containing details of what questions students received
+    questions = get_questions(config, max_question)
+    solution_path = prepare_build(config, output_dir_name, output_format, questions, force, resume,
+                                  solution_only)
+    if solution_only:
+        return
+    if shards:
+        output_path = get_test_directory_path(config, output_dir_name)
+        _coordinate_shards(config, output_path, output_dir_name, shards, local_workers,
+                           max_question, max_questions, output_format, jobs, timeout, retries,
+                           min_free_memory)
+        return
 
-    print("Generating PDFs...")
-    results = parmap.starmap(
-        _build_test,
-        all_test_data,
-        pm_pbar=True
-    )
+    plan = plan_build(config, output_dir_name, max_question, max_questions, output_format,
+                      questions=questions)
+    results, failures = render_build(config, plan, resume, jobs, timeout, retries,
+                                     min_free_memory)
+    _print_failures(failures, output_dir_name)
+    if optimize and output_format == "pdf":
+        paths = {student.id: test_path for student, test_path in results}
+        paths[config.solution_file_name] = solution_path
+        print("Optimizing PDF files...")
+        sizes, optimize_failures = optimize_build(paths, optimize_quality, jobs, min_free_memory)
+        _print_optimization(sizes, paths)
+        for key, error in sorted(optimize_failures.items()):
+            print(f"! Could not optimize '{os.path.basename(paths[key])}': {error}")
+    elif optimize:
+        print("! Only PDF builds can be optimized.")
     if email:
-        # Gather login information; update context as necessary
-        # TODO: validate user input
-        email_server = config.context["email_server"]
-        email_server_port = config.context["email_server_port"]
         instructor_email = config.context["instructor_email"]
         grader_email = config.context["grader_email"] if "grader_email" in config.context else None
         # TODO: following is way too specific, switch to use config.context["active_course"]
@@ -214,8 +346,8 @@ def build(config: Config, output_dir_name: str, dryrun: bool, force: bool, solut
         outgoing = []
         print("Building test emails...")
         for student, test_path in tqdm.tqdm(results):
-            outgoing.append(_get_email(
-                to_email=student["email"],
+            outgoing.append(get_email(
+                to_email=student.email,
                 from_email=instructor_email,
                 subject=test_subject,
                 attachment_path=test_path,
@@ -225,7 +357,7 @@ def build(config: Config, output_dir_name: str, dryrun: bool, force: bool, solut
         # Send the latest solution to the grader
         if grader_email:
             print("Building solution email for grader... ", end="")
-            outgoing.append(_get_email(
+            outgoing.append(get_email(
                 to_email=config.context["grader_email"],
                 from_email=instructor_email,
                 # TODO: following is way too specific, switch to use config.context["active_course"]
@@ -235,42 +367,8 @@ def build(config: Config, output_dir_name: str, dryrun: bool, force: bool, solut
                 cc_email=instructor_email
             ))
             print("done")
-        # Send all emails
-        print(f"Authenticating as '{instructor_email}' at '{email_server}'")
-        with smtplib.SMTP(email_server, email_server_port) as ems:
-            ems.ehlo()
-            ems.starttls()
-            instructor_password = getpass(f"Enter '{instructor_email}' password: ")
-            ems.login(instructor_email, instructor_password)
-            print("Authenticated!")
-            print(f"Sending tests{' and solution' if grader_email else ''}...")
-            for email in tqdm.tqdm(outgoing):
-                ems.send_message(email)
-
-
-def _get_email(to_email, from_email, subject, attachment_path, body_path=None,
-               cc_email=None):
-    msg = EmailMessage()
-    body = "See attachment."
-    if body_path and os.path.exists(body_path):
-        with open(body_path) as fp:
-            body = fp.read()
-    msg.set_content(body)
-
-    base_file_name = os.path.basename(attachment_path)
-    with open(attachment_path, "rb") as fp:
-        attachment = fp.read()
-    msg.add_attachment(
-        attachment,
-        maintype="application/pdf",
-        subtype="pdf",
-        filename=base_file_name)
-    msg["Subject"] = subject
-    msg["From"] = from_email
-    msg["To"] = to_email
-    msg["Cc"] = cc_email
-    return msg
+        send_emails(config, outgoing, f"tests{' and solution' if grader_email else ''}")
 
 
-class TestDirectoryExistsError(Exception):
+class ShardedBuildError(Exception):
     pass
@@ -0,0 +1,61 @@
+import os
+import shutil
+import subprocess
+
+from PyPDF2 import PdfReader, PdfWriter
+
+PDF_QUALITIES = ["screen", "ebook", "printer", "prepress"]  # Ghostscript's PDFSETTINGS presets
+
+
+def _run_ghostscript(input_path: str, output_path: str, quality: str):
+    """Rewrites a PDF with Ghostscript, subsetting fonts, downsampling images and compressing
+    streams.
+    """
+    subprocess.run([
+        "gs",
+        "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.5",
+        f"-dPDFSETTINGS=/{quality}",
+        "-dSubsetFonts=true",
+        "-dCompressFonts=true",
+        "-dDetectDuplicateImages=true",
+        "-dNOPAUSE",
+        "-dBATCH",
+        "-dQUIET",
+        f"-sOutputFile={output_path}",
+        input_path
+    ], check=True, capture_output=True)
+
+
+def _compress_streams(input_path: str, output_path: str):
+    """Rewrites a PDF with its content streams compressed, when Ghostscript isn't available.
+    """
+    reader = PdfReader(input_path)
+    writer = PdfWriter()
+    for page in reader.pages:
+        page.compress_content_streams()
+        writer.add_page(page)
+    if reader.metadata:
+        writer.add_metadata(reader.metadata)
+    with open(output_path, "wb") as fout:
+        writer.write(fout)
+
+
+def optimize_pdf(path: str, quality: str = "ebook") -> tuple:
+    """Shrinks a PDF in place, keeping the original if the result would be larger.
+
+    Returns the size of the file before and after.
+    """
+    size_before = os.path.getsize(path)
+    partial_path = f"{path}.{os.getpid()}.part"
+    try:
+        if shutil.which("gs"):
+            _run_ghostscript(path, partial_path, quality)
+        else:
+            _compress_streams(path, partial_path)
+        if os.path.getsize(partial_path) < size_before:
+            os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return size_before, os.path.getsize(path)
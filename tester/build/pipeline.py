@@ -0,0 +1,324 @@
+import hashlib
+import json
+import os
+import random
+import time
+
+import parmap
+import pdfkit
+import tqdm
+from markdown2 import markdown
+from PyPDF2 import PdfMerger
+
+from tester.build.assets import AssetCache
+from tester.build.render import Checkpoint, JobRunner
+from tester.build.template import TestTemplate
+from tester.config import Config
+from tester.questions.bundle import open_question_bundle
+from tester.student.model import Student
+
+SOLUTION_CACHE_MAX_AGE = 60 * 60 * 24 * 30  # seconds
+RENDER_TIMEOUT = 300  # seconds
+RENDER_RETRIES = 2
+MIN_FREE_MEMORY = 512  # megabytes kept free while rendering
+
+
+def get_test_directory_path(config: Config, output_dir_name: str) -> str:
+    return os.path.join(config.active_course_path, config.tests_dir_name, output_dir_name)
+
+
+def get_next_questions(student: Student, questions: dict, max_questions: int):
+    """Obtains the next set of questions for the given student and question pool.
+    """
+    sorted_question_keys = sorted(questions.keys())
+    selected_questions = []
+    questions_added = 0
+    answered_questions = student.all_answered
+    for q_num in sorted_question_keys:
+        already_answered = q_num in answered_questions
+        cant_answer = q_num in student.disallowed
+        if already_answered or cant_answer:
+            continue
+        selected_questions.append(questions[q_num])
+        questions_added += 1
+        if questions_added >= max_questions:
+            break
+
+    return selected_questions
+
+
+def write_html(html_text: str, output_path: str, stylesheet_href: str):
+    """Writes a standalone HTML document that links the shared stylesheet.
+    """
+    with open(output_path, "w") as fout:
+        fout.write(
+            "<html><head><meta charset=\"utf-8\">"
+            "<link rel=\"stylesheet\" href=\"{}\"></head>"
+            "<body style=\"\">{}</body></html>".format(stylesheet_href, html_text)
+        )
+
+
+def get_stylesheet_href(config: Config) -> str:
+    """Returns the fingerprinted path of the custom CSS, relative to a test directory.
+    """
+    with open(config.custom_css_file_path, "rb") as fin:
+        fingerprint = hashlib.sha256(fin.read()).hexdigest()[:12]
+    css_name, css_ext = os.path.splitext(config.custom_css_file_name)
+    return f"{config.assets_dir_name}{css_name}.{fingerprint}{css_ext}"
+
+
+def get_asset_cache(config: Config, output_path: str = None) -> AssetCache:
+    """Returns the cache of pre-rendered math and diagrams.
+
+    If an output directory is given, e.g. for HTML output, the assets used are copied into its
+    asset directory and referenced from there.
+    """
+    cache_path = os.path.join(config.cache_dir_path, config.asset_cache_dir_name)
+    if output_path is None:
+        return AssetCache(cache_path)
+    return AssetCache(cache_path, os.path.join(output_path, config.assets_dir_name),
+                      config.assets_dir_name)
+
+
+def build_asset_bundle(config: Config, output_path: str) -> str:
+    """Copies the custom CSS into the test's asset directory under a content fingerprint.
+
+    Returns the path of the stylesheet relative to the test directory.
+    """
+    with open(config.custom_css_file_path, "rb") as fin:
+        css_content = fin.read()
+    stylesheet_href = get_stylesheet_href(config)
+    stylesheet_path = os.path.join(output_path, stylesheet_href)
+    os.makedirs(os.path.dirname(stylesheet_path), exist_ok=True)
+    if not os.path.exists(stylesheet_path):
+        with open(stylesheet_path, "wb") as fout:
+            fout.write(css_content)
+    return stylesheet_href
+
+
+def get_pdf_options(config: Config, html_text: str) -> dict:
+    """Returns the wkhtmltopdf options for a document, allowing local file access only when it
+    references pre-rendered assets in the cache.
+    """
+    if "src=\"file://" not in html_text:
+        return config.pdf_options
+    return dict(config.pdf_options, **{"enable-local-file-access": ""})
+
+
+def build_test(config: Config, output_path: str, output_dir_name: str, student: Student,
+               test_content: str, dryrun: bool, output_format: str = "pdf",
+               stylesheet_href: str = None) -> tuple:
+    """Generates a single test from the student's assembled markdown document.
+    """
+    file_ext = config.test_file_ext if output_format == "pdf" else config.html_file_ext
+    output_file_name = "{}_{}.{}".format(student.last_name, student.id, file_ext)
+    test_output_path = os.path.join(output_path, output_file_name)
+    if not dryrun:
+        html_text = markdown(test_content, extras=["tables"])
+        if output_format == "html":
+            write_html(html_text, test_output_path, stylesheet_href)
+        else:
+            html_text = "<html><body style=\"\">" + html_text + "</body></html>"
+            pdfkit.from_string(
+                html_text,
+                test_output_path,
+                options=get_pdf_options(config, html_text),
+                css=config.custom_css_file_path
+            )
+    return (student, test_output_path)
+
+
+def get_solution_sections(config: Config, questions: dict, assets: AssetCache = None) -> list:
+    """Assembles the solution markdown as one section for the header and one per question.
+
+    Math and diagrams are pre-rendered with `assets`, if given.
+    """
+    with open(config.solution_header_path, "r") as fin:
+        sections = [fin.read()]
+
+    bundle = open_question_bundle(config)
+    for q_num in sorted(questions.keys()):
+        section_content = ""
+        sorted_question_options = sorted(questions[q_num]["options"])
+        for o_num, option in enumerate(sorted_question_options, start=1):
+            question_content = None
+            answer_content = None
+            if bundle:
+                question_content = [x.strip("<br/>") for x in bundle.read_option_lines(option)]
+                answer_content = bundle.read_solution_lines(option)
+            else:
+                with open(option, "r") as fin:
+                    question_content = [x.strip("<br/>") for x in fin.readlines()]
+                with open(config.get_solution_path(option), "r") as fin:
+                    answer_content = [x for x in fin.readlines()]
+
+            if question_content and answer_content:
+                section_content += "## Question {}.{}\n\n".format(q_num, o_num)
+                section_content += "".join(question_content)
+
+                section_content += "#### Answer {}.{}\n\n".format(q_num, o_num)
+                section_content += "".join(answer_content)
+        if section_content:
+            sections.append(assets.preprocess(section_content) if assets else section_content)
+
+    return sections
+
+
+def _render_solution_section(config: Config, section_content: str, section_path: str):
+    """Renders a single solution section to a PDF in the solution cache.
+    """
+    html_text = markdown(section_content, extras=["tables"])
+    html_text = "<html><body style=\"\">" + html_text + "</body></html>"
+    partial_path = f"{section_path}.{os.getpid()}.part"
+    pdfkit.from_string(
+        html_text,
+        partial_path,
+        options=get_pdf_options(config, html_text),
+        css=config.custom_css_file_path
+    )
+    os.replace(partial_path, section_path)
+
+
+def _prune_solution_cache(cache_path: str):
+    """Removes cached solution sections that have not been used for a while.
+    """
+    cutoff = time.time() - SOLUTION_CACHE_MAX_AGE
+    for file_name in os.listdir(cache_path):
+        file_path = os.path.join(cache_path, file_name)
+        if os.path.getmtime(file_path) < cutoff:
+            os.remove(file_path)
+
+
+def build_solution(config: Config, solution_path, questions):
+    """Generates a single file with all questions and answers.
+
+    Each question is rendered as its own section, cached by a hash of its content and the
+    rendering settings, so only edited questions are rendered again.
+    """
+    cache_path = os.path.join(config.cache_dir_path, config.solution_cache_dir_name)
+    os.makedirs(cache_path, exist_ok=True)
+    with open(config.custom_css_file_path, "rb") as fin:
+        render_settings = fin.read()
+    render_settings += json.dumps(config.pdf_options, sort_keys=True).encode()
+
+    section_paths = []
+    sections_to_render = []
+    for section_content in get_solution_sections(config, questions, get_asset_cache(config)):
+        section_hash = hashlib.sha256(render_settings + section_content.encode()).hexdigest()
+        section_path = os.path.join(cache_path, f"{section_hash}.{config.solution_file_ext}")
+        section_paths.append(section_path)
+        if os.path.exists(section_path):
+            os.utime(section_path)
+        else:
+            sections_to_render.append((config, section_content, section_path))
+
+    if sections_to_render:
+        print("Rendering {} of {} solution sections...".format(
+            len(sections_to_render),
+            len(section_paths)
+        ))
+        parmap.starmap(_render_solution_section, sections_to_render, pm_pbar=True)
+
+    merger = PdfMerger()
+    for section_path in section_paths:
+        merger.append(section_path)
+    merger.write(solution_path)
+    merger.close()
+    _prune_solution_cache(cache_path)
+
+
+def build_solution_html(config: Config, solution_path, questions, stylesheet_href: str):
+    """Generates a single HTML file with all questions and answers.
+    """
+    assets = get_asset_cache(config, os.path.dirname(solution_path))
+    solution_content = "".join(get_solution_sections(config, questions, assets))
+    html_text = markdown(solution_content, extras=["tables"])
+    write_html(html_text, solution_path, stylesheet_href)
+
+
+def plan_tests(config: Config, students: dict, questions: dict, max_questions: int,
+               output_path: str, output_dir_name: str, dryrun: bool, output_format: str,
+               stylesheet_href: str) -> tuple:
+    """Selects questions for each student and assembles their test documents.
+
+    Returns the arguments for rendering each test and the manifest of question assignments. On a
+    dry run only the selected question numbers are recorded and nothing is assembled.
+    """
+    all_test_data = []
+    manifest = {}
+    template = None
+    if not dryrun:
+        assets = get_asset_cache(config, output_path if output_format == "html" else None)
+        bundle = open_question_bundle(config)
+        if bundle:
+            template = TestTemplate.from_config(config, read_lines=bundle.read_option_lines,
+                                                preprocess=assets.preprocess,
+                                                get_line_count=bundle.get_line_count)
+        else:
+            template = TestTemplate.from_config(config, preprocess=assets.preprocess)
+    print("Acquiring test data...")
+    for sid, student in tqdm.tqdm(students.items()):
+        student_max_questions = student.max_questions if not max_questions else int(max_questions)
+        selected_questions = get_next_questions(student, questions, student_max_questions)
+        if not selected_questions:
+            print("! Student {} has no questions; no test will be generated.".format(sid))
+            continue  # If the student has no questions, print a message and skip them
+
+        if dryrun:
+            manifest[sid] = {"questions": [q["num"] for q in selected_questions]}
+            continue
+
+        selected_options = [(q["num"], random.choice(q["options"])) for q in selected_questions]
+        manifest[sid] = {
+            "questions": [q_num for q_num, _ in selected_options],
+            "options": [
+                os.path.relpath(option_path, config.questions_dir_path)
+                for _, option_path in selected_options
+            ]
+        }
+        test_content = template.render(student, selected_options)
+
+        test_data = (config, output_path, output_dir_name, student, test_content, dryrun,
+                     output_format, stylesheet_href)
+        all_test_data.append(test_data)
+
+    return all_test_data, manifest
+
+
+def render_tests(all_test_data: list, output_format: str, runner: JobRunner,
+                 checkpoint: Checkpoint = None) -> tuple:
+    """Renders every planned test in parallel, each as an isolated job.
+
+    Returns the (student, test path) pairs that were rendered and the errors of those that
+    weren't, keyed by student ID. Completed and failed tests are recorded in the checkpoint, if
+    given.
+    """
+    print("Generating {} files...".format(output_format.upper()))
+    jobs = {test_data[3].id: test_data for test_data in all_test_data}
+    on_success = (lambda sid, result: checkpoint.record(sid, result[1])) if checkpoint else None
+    on_failure = checkpoint.record_failure if checkpoint else None
+    results, failures = runner.run(build_test, jobs, on_success=on_success, on_failure=on_failure)
+    return list(results.values()), failures
+
+
+def resume_from_checkpoint(all_test_data: list, manifest: dict, previous_manifest: dict,
+                           completed: dict) -> list:
+    """Drops already completed tests from a plan, keeping their recorded question assignments.
+    """
+    remaining_test_data = []
+    for test_data in all_test_data:
+        sid = test_data[3].id
+        if sid in completed and sid in previous_manifest:
+            manifest[sid] = previous_manifest[sid]
+        else:
+            remaining_test_data.append(test_data)
+    if len(remaining_test_data) < len(all_test_data):
+        print(": Resuming; {} of {} tests are already built.".format(
+            len(all_test_data) - len(remaining_test_data),
+            len(all_test_data)
+        ))
+    return remaining_test_data
+
+
+class TestDirectoryExistsError(Exception):
+    pass
@@ -0,0 +1,269 @@
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+import tqdm
+
+SAMPLE_INTERVAL = 1.0  # seconds between checks of memory and CPU load
+JOB_MEMORY_ESTIMATE = 256 * 1024 * 1024  # bytes a single render is assumed to need
+MAX_LOAD_PER_CPU = 1.0
+
+
+def _serve_jobs(func, conn):
+    """Runs the jobs sent by a runner in a long-lived child process, sending back each result or
+    error, until the runner sends None.
+    """
+    # Lead a new process group so a timed out job can be killed along with wkhtmltopdf
+    os.setsid()
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            return  # The runner is gone
+        if args is None:
+            return
+        try:
+            outcome = (True, func(*args))
+        except Exception as e:
+            outcome = (False, f"{type(e).__name__}: {e}")
+        try:
+            conn.send(outcome)
+        except Exception as e:  # The result couldn't be pickled
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+def _receive_outcome(process: multiprocessing.Process, conn) -> tuple:
+    """Receives the outcome a job's process sent, or a failure if it closed the pipe without one.
+    """
+    try:
+        return conn.recv()
+    except EOFError:
+        process.join()
+        return (False, f"Process exited with code {process.exitcode}")
+
+
+def get_available_memory() -> int:
+    """Returns the number of bytes of memory available to new processes, or None if unknown.
+    """
+    try:
+        with open("/proc/meminfo", "r") as fin:
+            for line in fin:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.virtual_memory().available
+
+
+def get_load_per_cpu() -> float:
+    """Returns the one minute load average per CPU, or None if unknown.
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class Checkpoint():
+    """An append-only record of the jobs of a build that have completed or failed for good.
+
+    The latest record of a job wins, so a job that failed and was rebuilt counts as completed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> dict:
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as fin:
+                for line in fin:
+                    if line.strip():
+                        record = json.loads(line)
+                        records[record["key"]] = record
+        return records
+
+    def load(self) -> dict:
+        """Returns the output path recorded for each completed job whose output still exists.
+        """
+        return {
+            k: r["path"] for k, r in self._read().items()
+            if "path" in r and os.path.exists(r["path"])
+        }
+
+    def load_failures(self) -> dict:
+        """Returns the error message recorded for each job that failed.
+        """
+        return {k: r["error"] for k, r in self._read().items() if "error" in r}
+
+    def record(self, key: str, path: str):
+        with open(self.path, "a") as fout:
+            fout.write(json.dumps({"key": key, "path": path}) + "\n")
+
+    def record_failure(self, key: str, error: str):
+        with open(self.path, "a") as fout:
+            fout.write(json.dumps({"key": key, "error": error}) + "\n")
+
+
+class JobRunner():
+    """Runs jobs in parallel in worker processes, each job with a timeout and bounded retries.
+
+    Workers are started as needed and reused for later jobs. A job that raises, crashes its worker
+    or times out is retried up to `retries` more times before being reported as a failure, so one
+    bad job never stops the others. A crashed or timed out worker is replaced.
+    """
+    def __init__(self, processes: int = None, timeout: float = None, retries: int = 0):
+        self.processes = processes or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retries = retries
+
+    def get_concurrency(self, running_count: int) -> int:
+        """Returns how many jobs may run at once right now.
+        """
+        return self.processes
+
+    def run(self, func, jobs: dict, on_success=None, on_failure=None) -> tuple:
+        """Runs `func(*args)` for every job, given as a dictionary of keys to arguments.
+
+        Returns a dictionary of results and a dictionary of error messages, both keyed by job.
+        `on_success(key, result)` is called as each job completes, and `on_failure(key, error)` as
+        each job runs out of retries.
+        """
+        pending = [(key, args, 1) for key, args in jobs.items()]
+        pending.reverse()  # Pop jobs in the order given
+        idle = []
+        running = {}
+        results = {}
+        failures = {}
+        try:
+            with tqdm.tqdm(total=len(jobs)) as pbar:
+                while pending or running:
+                    while pending and len(running) < self.get_concurrency(len(running)):
+                        key, args, attempt = pending.pop()
+                        process, conn = idle.pop() if idle else self._start_worker(func)
+                        running[key] = (process, conn, time.monotonic(), args, attempt)
+                        try:
+                            conn.send(args)
+                        except (BrokenPipeError, ConnectionResetError):
+                            pass  # The worker died while idle, which is handled below
+
+                    ready = multiprocessing.connection.wait(
+                        [c for _, c, _, _, _ in running.values()] +
+                        [p.sentinel for p, _, _, _, _ in running.values()],
+                        self._get_wait_timeout(running, pending)
+                    )
+                    for key, (process, conn, started, args, attempt) in list(running.items()):
+                        outcome = None
+                        if conn in ready:
+                            outcome = _receive_outcome(process, conn)
+                        elif process.sentinel in ready:
+                            # The job may have sent its result and exited since the wait returned
+                            if conn.poll(0):
+                                outcome = _receive_outcome(process, conn)
+                            else:
+                                process.join()
+                                outcome = (False, f"Process exited with code {process.exitcode}")
+                        elif self.timeout and time.monotonic() - started > self.timeout:
+                            self._kill(process)
+                            outcome = (False, f"Timed out after {self.timeout}s")
+                        if outcome is None:
+                            continue
+
+                        del running[key]
+                        if process.is_alive():
+                            idle.append((process, conn))
+                        else:
+                            process.join()
+                            conn.close()
+                        succeeded, value = outcome
+                        if succeeded:
+                            results[key] = value
+                            if on_success:
+                                on_success(key, value)
+                            pbar.update()
+                        elif attempt <= self.retries:
+                            pending.append((key, args, attempt + 1))
+                        else:
+                            failures[key] = value
+                            if on_failure:
+                                on_failure(key, value)
+                            pbar.update()
+        finally:
+            for process, conn in idle:
+                try:
+                    conn.send(None)
+                    process.join()
+                except (BrokenPipeError, ConnectionResetError):
+                    process.join()
+                conn.close()
+            for process, conn, _, _, _ in running.values():
+                self._kill(process)
+                conn.close()
+        return results, failures
+
+    def _get_wait_timeout(self, running: dict, pending: list) -> float:
+        """Returns how long to wait for a job to finish before checking on the others.
+
+        Waiting ends at the earliest job deadline, and after the sampling interval while jobs are
+        held back so that more may start once resources free up.
+        """
+        timeouts = []
+        if self.timeout:
+            earliest = min(started for _, _, started, _, _ in running.values())
+            timeouts.append(earliest + self.timeout - time.monotonic())
+        if pending:
+            timeouts.append(SAMPLE_INTERVAL)
+        return max(min(timeouts), 0) if timeouts else None
+
+    @staticmethod
+    def _start_worker(func) -> tuple:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_serve_jobs, args=(func, child_conn),
+                                          daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    @staticmethod
+    def _kill(process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            process.kill()  # Not yet leading its own group
+        process.join()
+
+
+class AdaptiveJobRunner(JobRunner):
+    """A job runner that starts jobs only while the machine has memory and CPU to spare.
+
+    At most `processes` jobs run at once. Each time memory and load are sampled, the runner allows
+    as many more jobs as fit in the available memory above `min_free_memory`, and none while the
+    CPUs are overloaded. At least one job always runs so the build keeps making progress.
+    """
+    def __init__(self, processes: int = None, timeout: float = None, retries: int = 0,
+                 min_free_memory: int = 0):
+        super().__init__(processes, timeout, retries)
+        self.min_free_memory = min_free_memory
+        self._limit = 1
+        self._sampled = None
+
+    def get_concurrency(self, running_count: int) -> int:
+        now = time.monotonic()
+        if self._sampled is None or now - self._sampled >= SAMPLE_INTERVAL:
+            self._sampled = now
+            self._limit = self.processes
+            available_memory = get_available_memory()
+            if available_memory is not None:
+                spare_jobs = (available_memory - self.min_free_memory) // JOB_MEMORY_ESTIMATE
+                self._limit = min(self._limit, running_count + max(spare_jobs, 0))
+            load = get_load_per_cpu()
+            if load is not None and load > MAX_LOAD_PER_CPU:
+                self._limit = min(self._limit, running_count)
+            self._limit = max(self._limit, 1)
+        return self._limit
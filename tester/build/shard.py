@@ -0,0 +1,209 @@
+import contextlib
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import zlib
+
+from tester.config import Config
+
+CLAIM_LEASE = 60  # seconds a claim stays valid without being renewed by its worker
+
+
+def parse_shard(shard: str) -> tuple:
+    """Parses a shard given as "i/N" into its 1-based number and the shard count.
+    """
+    try:
+        shard_num, shard_count = (int(x) for x in shard.split("/"))
+    except ValueError:
+        raise InvalidShardError(f"Shard '{shard}' should look like 'i/N', e.g. '1/4'.")
+    if not 1 <= shard_num <= shard_count:
+        raise InvalidShardError(f"Shard number must be between 1 and {shard_count}.")
+    return shard_num, shard_count
+
+
+def shard_name(shard_num: int, shard_count: int) -> str:
+    return f"{shard_num}-of-{shard_count}"
+
+
+def in_shard(sid: str, shard_num: int, shard_count: int) -> bool:
+    """Deterministically assigns a student to one shard, the same way on every machine.
+    """
+    return zlib.crc32(sid.encode()) % shard_count == shard_num - 1
+
+
+def get_part_path(path: str, part: str) -> str:
+    """Returns the path of one shard's part of an output file, e.g. "_manifest.1-of-4.json".
+    """
+    name, ext = os.path.splitext(path)
+    return f"{name}.{part}{ext}"
+
+
+def start_shard_log(config: Config, output_path: str, part: str):
+    """Removes the log of a previous run of a shard, marking the shard as not yet built.
+    """
+    log_path = get_part_path(os.path.join(output_path, config.build_log_file_name), part)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
+
+def write_shard_log(config: Config, output_path: str, part: str, results: list):
+    """Records which tests a shard built, and on which machine.
+
+    The log is written once the shard has finished rendering, so its presence marks the shard as
+    built.
+    """
+    log_path = get_part_path(os.path.join(output_path, config.build_log_file_name), part)
+    host = socket.gethostname()
+    partial_path = f"{log_path}.{os.getpid()}.part"
+    with open(partial_path, "w") as fout:
+        for student, test_path in results:
+            fout.write(f"{part} {host} {student.id} {os.path.basename(test_path)}\n")
+    os.replace(partial_path, log_path)
+
+
+def merge_shard_outputs(config: Config, output_path: str, shard_count: int) -> bool:
+    """Merges the manifests and logs of every shard once all of them are built.
+
+    Returns whether the merge happened. Merging is idempotent, so concurrent shards finishing at
+    the same time may both merge safely.
+    """
+    manifest_path = os.path.join(output_path, config.manifest_file_name)
+    log_path = os.path.join(output_path, config.build_log_file_name)
+    parts = [shard_name(i, shard_count) for i in range(1, shard_count + 1)]
+    manifest_parts = [get_part_path(manifest_path, part) for part in parts]
+    if not all(os.path.exists(get_part_path(log_path, part)) for part in parts):
+        return False
+
+    manifest = {}
+    for manifest_part in manifest_parts:
+        with open(manifest_part, "r") as fin:
+            manifest.update(json.load(fin))
+    partial_path = f"{manifest_path}.{os.getpid()}.part"
+    with open(partial_path, "w") as fout:
+        json.dump(manifest, fout, indent=config.json_indent, sort_keys=True)
+    os.replace(partial_path, manifest_path)
+
+    partial_path = f"{log_path}.{os.getpid()}.part"
+    with open(partial_path, "w") as fout:
+        for part in parts:
+            log_part = get_part_path(log_path, part)
+            if os.path.exists(log_part):
+                with open(log_part, "r") as fin:
+                    shutil.copyfileobj(fin, fout)
+    os.replace(partial_path, log_path)
+    return True
+
+
+class WorkQueue():
+    """A queue of build tasks shared between machines through the filesystem.
+
+    Tasks move from `pending/` to `claimed/` to `done/` by renaming, which is atomic, so each task
+    is claimed by exactly one worker. Workers renew their claims by touching the claimed file, so
+    claims whose worker died can be found by their age and moved back to `pending/`.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.pending_path = os.path.join(path, "pending")
+        self.claimed_path = os.path.join(path, "claimed")
+        self.done_path = os.path.join(path, "done")
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.pending_path)
+
+    def create(self, tasks: dict):
+        """Creates the queue with the given tasks, keyed by task name.
+        """
+        for path in (self.pending_path, self.claimed_path, self.done_path):
+            os.makedirs(path, exist_ok=True)
+        for name, task in tasks.items():
+            with open(os.path.join(self.path, name), "w") as fout:
+                json.dump(task, fout)
+            os.replace(os.path.join(self.path, name), os.path.join(self.pending_path, name))
+
+    def claim(self) -> tuple:
+        """Claims the next pending task, returning its name and content, or None if none remain.
+        """
+        for name in sorted(os.listdir(self.pending_path)):
+            try:
+                os.rename(os.path.join(self.pending_path, name),
+                          os.path.join(self.claimed_path, name))
+                self.renew(name)  # Renaming keeps the mtime of when the task was queued
+                with open(os.path.join(self.claimed_path, name), "r") as fin:
+                    return name, json.load(fin)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+        return None
+
+    def renew(self, name: str):
+        """Renews the lease of a claimed task.
+        """
+        os.utime(os.path.join(self.claimed_path, name))
+
+    @contextlib.contextmanager
+    def keep_claimed(self, name: str, lease: float = CLAIM_LEASE):
+        """Renews the lease of a claimed task in the background until the block exits.
+        """
+        stopped = threading.Event()
+
+        def renew_until_stopped():
+            while not stopped.wait(lease / 4):
+                try:
+                    self.renew(name)
+                except FileNotFoundError:
+                    return  # Requeued by the coordinator, which will give it to another worker
+
+        renewer = threading.Thread(target=renew_until_stopped, daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            renewer.join()
+
+    def stale_claims(self, lease: float = CLAIM_LEASE) -> list:
+        """Returns the names of claimed tasks whose lease ran out without being renewed.
+        """
+        stale = []
+        expiry = time.time() - lease
+        for name in sorted(os.listdir(self.claimed_path)):
+            try:
+                if os.path.getmtime(os.path.join(self.claimed_path, name)) < expiry:
+                    stale.append(name)
+            except FileNotFoundError:
+                continue  # Completed in the meantime
+        return stale
+
+    def requeue(self, name: str):
+        """Moves a claimed task back to pending so another worker can claim it.
+        """
+        try:
+            os.rename(os.path.join(self.claimed_path, name), os.path.join(self.pending_path, name))
+        except FileNotFoundError:
+            pass  # Completed in the meantime
+
+    def complete(self, name: str):
+        """Marks a task done, even if it was requeued after its lease ran out.
+        """
+        for path in (self.claimed_path, self.pending_path):
+            try:
+                os.rename(os.path.join(path, name), os.path.join(self.done_path, name))
+                return
+            except FileNotFoundError:
+                continue
+
+    def counts(self) -> tuple:
+        """Returns the number of pending, claimed and done tasks.
+        """
+        return tuple(
+            len(os.listdir(p)) for p in (self.pending_path, self.claimed_path, self.done_path)
+        )
+
+    def remove(self):
+        shutil.rmtree(self.path)
+
+
+class InvalidShardError(Exception):
+    pass
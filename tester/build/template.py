@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+from tester.config import Config
+
+MAX_LINES = 55
+PAGE_BREAK = "<p class='keep-together break-after'><p>\n"
+NAME_BLOCK = "**Name: {0} {1} (ID: {2}) (Section: {3})**\n\n"
+
+QuestionFragment = namedtuple("QuestionFragment", ["content", "line_count"])
+
+
+def count_lines(question_lines: list) -> int:
+    """Estimates the number of lines a question takes up on the page.
+    """
+    line_count = len(question_lines)
+    for line in question_lines:
+        # adding an extra line for each table row
+        if line.startswith("|") and not line.startswith("|-"):
+            line_count += 1
+    return line_count
+
+
+def read_option_lines(option_path: str) -> list:
+    """Reads the lines of a question option from the question pool.
+    """
+    with open(option_path, "r") as fin:
+        return fin.readlines()
+
+
+class TestTemplate():
+    """A test document compiled once per build.
+
+    The header is read once and each question option is compiled into a fragment the first time
+    it is selected, so every student's document is assembled with a single join. `preprocess`,
+    if given, transforms each option's markdown once as it is compiled. `get_line_count`, if
+    given, returns an option's precomputed line footprint, or None to count its lines instead.
+    """
+    def __init__(self, header_content: str, read_lines=read_option_lines, preprocess=None,
+                 get_line_count=None):
+        self.header = "{}\n\n".format(header_content)
+        self.read_lines = read_lines
+        self.preprocess = preprocess
+        self.get_line_count = get_line_count
+        self.fragments = {}
+
+    @classmethod
+    def from_config(cls, config: Config, **kwargs):
+        with open(config.test_header_path, "r") as fin:
+            return cls(fin.read(), **kwargs)
+
+    def get_fragment(self, q_num: int, option_path: str) -> QuestionFragment:
+        """Returns the compiled fragment of a question option.
+        """
+        key = (q_num, option_path)
+        if key not in self.fragments:
+            question_lines = self.read_lines(option_path)
+            assert question_lines, "Question at '{}' has no content".format(option_path)
+            question_content = "".join(question_lines)
+            if self.preprocess:
+                question_content = self.preprocess(question_content)
+            content = "**{}.** {}".format(q_num, question_content)  # TODO: include option #
+            line_count = self.get_line_count(option_path) if self.get_line_count else None
+            if line_count is None:
+                line_count = count_lines(question_lines)
+            self.fragments[key] = QuestionFragment(content, line_count)
+        return self.fragments[key]
+
+    def render(self, student, selected_options: list) -> str:
+        """Assembles the markdown document for a student from (question #, option path) pairs.
+        """
+        parts = [
+            self.header,
+            NAME_BLOCK.format(student.first_name, student.last_name, student.id, student.section)
+        ]
+        line_count = 0
+        for q_num, option_path in selected_options:
+            fragment = self.get_fragment(q_num, option_path)
+            line_count += fragment.line_count
+            if line_count > MAX_LINES:
+                parts.append(PAGE_BREAK)
+                line_count = fragment.line_count
+            parts.append(fragment.content)
+        return "".join(parts)
@@ -0,0 +1,49 @@
+import os
+import time
+
+from tester.config import Config
+
+
+def get_watched_paths(config: Config) -> list:
+    """Returns the files and directories whose changes affect a build preview.
+    """
+    return [
+        config.questions_dir_path,
+        config.test_header_path,
+        config.solution_header_path,
+        config.custom_css_file_path,
+    ]
+
+
+def snapshot_mtimes(paths: list) -> dict:
+    """Records the modification time of every file found at or beneath the given paths.
+    """
+    mtimes = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, file_names in os.walk(path):
+                for file_name in file_names:
+                    file_path = os.path.join(dir_path, file_name)
+                    try:
+                        mtimes[file_path] = os.stat(file_path).st_mtime_ns
+                    except FileNotFoundError:
+                        pass  # Removed while walking, the next snapshot will notice
+        elif os.path.exists(path):
+            mtimes[path] = os.stat(path).st_mtime_ns
+    return mtimes
+
+
+def wait_for_changes(paths: list, previous: dict, interval: float) -> tuple:
+    """Polls the given paths until something is added, removed or modified.
+
+    Returns the new snapshot and the sorted list of changed files.
+    """
+    while True:
+        time.sleep(interval)
+        current = snapshot_mtimes(paths)
+        if current != previous:
+            changed = {
+                p for p in set(current) | set(previous)
+                if current.get(p) != previous.get(p)
+            }
+            return current, sorted(changed)
@@ -2,13 +2,20 @@ import json
 import os
 import re
 
+from tester.module.index import ModuleIndex, load_module_index
+from tester.student.journal import StudentJournal
+from tester.student.model import Student
+
+STUDENT_INDEX_FIELDS = ["id", "first_name", "last_name", "email", "section", "username"]
+
 
 class Config():
     """Configuration management commands and information.
     """
-    def __init__(self):
-        # Checking for data directory
-        data_path = os.environ.get("TESTER_DATA_DIR_PATH")
+    def __init__(self, data_path: str = None, course_name: str = None):
+        # Checking for data directory, unless one was given
+        if data_path is None:
+            data_path = os.environ.get("TESTER_DATA_DIR_PATH")
 
         # Ensure the data directory path to an absolute path
         if data_path is None:
@@ -31,14 +38,34 @@ class Config():
         self.context_file_name = "context.json"
         self.question_dir_name = "_questions/"
         self.tests_dir_name = "_tests/"
+        self.cache_dir_name = "_cache/"
+        self.solution_cache_dir_name = "solution/"
+        self.asset_cache_dir_name = "assets/"
+        self.preview_cache_dir_name = "preview/"
+        self.question_check_cache_file_name = "question_check.json"
+        self.question_bundle_file_name = "questions.bundle"
         self.modules_file_name = "modules.json"
         self.students_file_name = "students.json"
+        self.students_index_file_name = "students_index.json"
+        self.students_journal_file_name = "students_journal.jsonl"
+        self.students_history_file_name = "students_history.jsonl"
+        self.students_base_file_name = "students_base.json"
+        self.journal_compact_ratio = 1.0  # Journal size, relative to the snapshot, to compact at
         self.test_file_ext = "pdf"
         self.test_header_file_name = "test_header.md"
         self.solution_file_ext = "pdf"
         self.solution_file_name = f"_solution.{self.solution_file_ext}"
         self.solution_header_file_name = "solution_header.md"
+        self.html_file_ext = "html"
+        self.solution_html_file_name = f"_solution.{self.html_file_ext}"
+        self.assets_dir_name = "_assets/"
         self.custom_css_file_name = "custom.css"
+        self.manifest_file_name = "_manifest.json"
+        self.build_log_file_name = "_build.log"
+        self.checkpoint_file_name = "_checkpoint.jsonl"
+        self.queue_dir_name = "_queue/"
+        self.archive_dir_name = "_archive/"
+        self.archive_index_file_name = "index.json"
         self.pdf_options = {
             "page-size": "Letter",
             "margin-top": "0.5in",
@@ -50,6 +77,8 @@ class Config():
             "log-level": "none"
         }
         self.email_body_file_name = "email_body.md"
+        self.reports_dir_name = "_reports/"
+        self.report_email_body_file_name = "report_email_body.md"
         self.email_server = None
         self.question_dir_pattern = re.compile(r"[0-9]+")
         self.question_file_pattern = re.compile(r"^[0-9]+\.md$")
@@ -68,14 +97,27 @@ class Config():
         with open(self.context_path, "r") as f:
             loaded_context = json.load(f)
             self.context.update(loaded_context)
+        if course_name:  # Work on a course without changing the saved active course
+            self.context["active_course"] = course_name
 
         if self.context["active_course"]:
             self.active_course_path = os.path.join(self.data_path, self.context["active_course"])
             self.active_course_path = os.path.abspath(self.active_course_path)
             self.students_file_path = os.path.join(self.active_course_path, self.students_file_name)
             self.students_file_path = os.path.abspath(self.students_file_path)
+            self.students_index_file_path = os.path.join(self.active_course_path,
+                                                         self.students_index_file_name)
+            self.students_journal = StudentJournal(
+                os.path.join(self.active_course_path, self.students_journal_file_name),
+                os.path.join(self.active_course_path, self.students_history_file_name),
+                os.path.join(self.active_course_path, self.students_base_file_name)
+            )
+            self._saved_students = None
             self.questions_dir_path = os.path.join(self.active_course_path, self.question_dir_name)
             self.questions_dir_path = os.path.abspath(self.questions_dir_path)
+            self.cache_dir_path = os.path.join(self.active_course_path, self.cache_dir_name)
+            self.cache_dir_path = os.path.abspath(self.cache_dir_path)
+            self.archive_dir_path = os.path.join(self.active_course_path, self.archive_dir_name)
             self.modules_file_path = os.path.join(self.active_course_path, self.modules_file_name)
             self.modules_file_path = os.path.abspath(self.modules_file_path)
             self.test_header_path = os.path.join(self.active_course_path,
@@ -88,9 +130,19 @@ class Config():
                                                      self.custom_css_file_name)
             self.email_body_file_path = os.path.join(self.active_course_path,
                                                      self.email_body_file_name)
+            self.report_email_body_file_path = os.path.join(self.active_course_path,
+                                                            self.report_email_body_file_name)
         else:
             raise NoActiveCourseError("! Please activate a course first!")
 
+    def __getstate__(self):
+        """Leaves the cached roster out when the configuration is sent to a render worker.
+        """
+        state = dict(self.__dict__)
+        if "_saved_students" in state:
+            state["_saved_students"] = None
+        return state
+
     def _save_context(self):
         """Saves out the current context to a JSON file.
         """
@@ -110,23 +162,121 @@ class Config():
         if number_list != list(range(min(number_list), max(number_list)+1)):
             raise QuestionsAreNotConsecutiveError("{} not consecutive.".format(list_type))
 
-    def get_students(self) -> dict:
-        """Obtains the students dictionary from the active course.
+    def _load_student_dicts(self) -> dict:
+        """Loads the students snapshot with the journal of later changes replayed over it.
         """
         with open(self.students_file_path) as fin:
             students = json.load(fin)
+        self.students_journal.replay(students, self.students_journal.read())
+        self._saved_students = students
         return students
 
-    def save_students(self, students: dict):
-        """Saves the students dictionary to the active course.
+    def get_students(self, as_of: str = None) -> dict:
+        """Obtains the students of the active course, keyed by student ID.
+
+        If `as_of` names a quiz, the students are returned as they were right after the last
+        change recorded for that quiz.
         """
+        if as_of:
+            students = self.students_journal.as_of(as_of)
+        else:
+            students = self._load_student_dicts()
+        return {sid: Student.from_dict(s) for sid, s in students.items()}
+
+    def save_students(self, students: dict, op: str = "save", quiz: str = None):
+        """Saves changes to the students of the active course as journal records.
+
+        The journal is compacted into the students snapshot once it grows as large as a fraction of
+        the snapshot, so replaying it never costs much more than loading the snapshot itself.
+        """
+        saved = self._saved_students
+        if saved is None:
+            saved = self._load_student_dicts()
+        students_dicts = {sid: s.to_dict() for sid, s in students.items()}
+        records = self.students_journal.diff(saved, students_dicts, op, quiz)
+        if not records:
+            return
+        self.students_journal.append(records, self.students_file_path)
+        self._saved_students = students_dicts
+        index_changed = any(
+            r["fields"] is None or set(r["fields"]).intersection(STUDENT_INDEX_FIELDS)
+            for r in records
+        )
+        snapshot_size = os.path.getsize(self.students_file_path)
+        if self.students_journal.size() >= snapshot_size * self.journal_compact_ratio:
+            self.compact_students()
+        elif index_changed or not os.path.exists(self.students_index_file_path):
+            self._save_students_index(students)
+
+    def compact_students(self):
+        """Folds the student journal into the students snapshot.
+        """
+        students = self._load_student_dicts()
         with open(self.students_file_path, "w") as fout:
             json.dump(students, fout, indent=self.json_indent, sort_keys=True)
+        self.students_journal.compact()
+        self._save_students_index({sid: Student.from_dict(s) for sid, s in students.items()})
+
+    def _save_students_index(self, students: dict):
+        """Saves the lightweight listing index of the given students.
+        """
+        index = [[getattr(s, f) for f in STUDENT_INDEX_FIELDS] for s in students.values()]
+        with open(self.students_index_file_path, "w") as fout:
+            json.dump({"fields": STUDENT_INDEX_FIELDS, "rows": index}, fout)
+
+    def get_students_index(self) -> list:
+        """Obtains the identifying fields of every student without loading their full records.
+
+        The index is rebuilt whenever it is missing or older than the students file.
+        """
+        index_is_stale = not os.path.exists(self.students_index_file_path) or \
+            os.path.getmtime(self.students_index_file_path) < \
+            os.path.getmtime(self.students_file_path)
+        if index_is_stale:
+            self._save_students_index(self.get_students())
+        with open(self.students_index_file_path) as fin:
+            index = json.load(fin)
+        return [dict(zip(index["fields"], row)) for row in index["rows"]]
+
+    def get_manifest(self, test_name: str) -> dict:
+        """Obtains the question assignments recorded when the named test was built.
+        """
+        manifest_path = os.path.join(self.active_course_path, self.tests_dir_name, test_name,
+                                     self.manifest_file_name)
+        if not os.path.exists(manifest_path):
+            raise MissingManifestError(f"No build manifest found for test '{test_name}'.")
+        with open(manifest_path) as fin:
+            manifest = json.load(fin)
+        return manifest
+
+    def save_manifest(self, test_name: str, manifest: dict, part: str = None):
+        """Saves the question assignments of a test build alongside its output.
+
+        Sharded builds save each shard's assignments as a separate part.
+        """
+        manifest_path = os.path.join(self.active_course_path, self.tests_dir_name, test_name,
+                                     self.manifest_file_name)
+        if part:
+            manifest_name, manifest_ext = os.path.splitext(manifest_path)
+            manifest_path = f"{manifest_name}.{part}{manifest_ext}"
+        with open(manifest_path, "w") as fout:
+            json.dump(manifest, fout, indent=self.json_indent, sort_keys=True)
 
     def get_modules(self) -> dict:
-        with open(self.modules_file_path, "r") as fin:
-            modules = json.load(fin)
-        return modules
+        """Obtains the modules dictionary from the active course.
+        """
+        return self.get_module_index().modules
+
+    def get_module_index(self) -> ModuleIndex:
+        """Obtains the module index of the active course, reused until modules.json changes.
+        """
+        return load_module_index(self.modules_file_path)
+
+    def get_solution_path(self, option_path: str) -> str:
+        """Returns the path of the solution file belonging to a question option.
+        """
+        option_name, option_ext = os.path.splitext(option_path)
+        return f"{option_name}.solution{option_ext}"
 
     def get_questions(self) -> dict:
         """Obtains questions from questions folder and ensures everything is proper.
@@ -170,3 +320,7 @@ class NoActiveCourseError(Exception):
 
 class QuestionsAreNotConsecutiveError(Exception):
     pass
+
+
+class MissingManifestError(Exception):
+    pass
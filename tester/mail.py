@@ -0,0 +1,55 @@
+import mimetypes
+import os
+import smtplib
+from email.message import EmailMessage
+from getpass import getpass
+
+import tqdm
+
+from tester.config import Config
+
+
+def get_email(to_email, from_email, subject, attachment_path, body_path=None,
+              cc_email=None):
+    msg = EmailMessage()
+    body = "See attachment."
+    if body_path and os.path.exists(body_path):
+        with open(body_path) as fp:
+            body = fp.read()
+    msg.set_content(body)
+
+    base_file_name = os.path.basename(attachment_path)
+    with open(attachment_path, "rb") as fp:
+        attachment = fp.read()
+    mime_type, _ = mimetypes.guess_type(attachment_path)
+    maintype, subtype = (mime_type or "application/pdf").split("/")
+    msg.add_attachment(
+        attachment,
+        maintype=maintype,
+        subtype=subtype,
+        filename=base_file_name)
+    msg["Subject"] = subject
+    msg["From"] = from_email
+    msg["To"] = to_email
+    msg["Cc"] = cc_email
+    return msg
+
+
+def send_emails(config: Config, outgoing: list, description: str):
+    """Sends emails from the instructor's account, logging in once for the whole batch.
+    """
+    # Gather login information; update context as necessary
+    # TODO: validate user input
+    email_server = config.context["email_server"]
+    email_server_port = config.context["email_server_port"]
+    instructor_email = config.context["instructor_email"]
+    print(f"Authenticating as '{instructor_email}' at '{email_server}'")
+    with smtplib.SMTP(email_server, email_server_port) as ems:
+        ems.ehlo()
+        ems.starttls()
+        instructor_password = getpass(f"Enter '{instructor_email}' password: ")
+        ems.login(instructor_email, instructor_password)
+        print("Authenticated!")
+        print(f"Sending {description}...")
+        for email in tqdm.tqdm(outgoing):
+            ems.send_message(email)
@@ -23,7 +23,7 @@ def _print_module_names(modules):
 def list_modules(config: Config):
     """Displays a list of modules found for the active course.
     """
-    modules = config.get_modules(config.modules_file_path)
+    modules = config.get_modules()
     if modules:
         print(": Modules:")
         _print_module_names(modules)
@@ -40,7 +40,7 @@ def add(config: Config, new_module_id, new_module_name):
     """
     print(": Creating new module: {}".format(new_module_name))
 
-    modules = config.get_modules(config.modules_file_path)
+    modules = dict(config.get_modules())
     if new_module_id in modules:
         error_msg = ": Module with that ID already exists. " + \
             "You'll have to use a different ID."
@@ -0,0 +1,47 @@
+import json
+import os
+
+_index_cache = {}
+
+
+class ModuleIndex():
+    """Lookup tables over the modules of a course.
+
+    Maps each question to its module and each module to its questions and homework, so grading
+    can use constant time lookups instead of scanning module lists.
+    """
+    def __init__(self, modules: dict):
+        self.modules = modules
+        self.module_questions = {}
+        self.module_hw = {}
+        self.question_module = {}
+        for m_id, module in modules.items():
+            self.module_questions[m_id] = tuple(dict.fromkeys(module["questions"]))
+            self.module_hw[m_id] = tuple(dict.fromkeys(module["hw"]))
+            for q_num in self.module_questions[m_id]:
+                self.question_module.setdefault(q_num, m_id)
+        self.all_questions = frozenset(self.question_module)
+
+    @property
+    def question_limit(self) -> int:
+        """The number of distinct questions across all modules.
+        """
+        return len(self.all_questions)
+
+    def missing_hw(self, m_id: str, submitted_hw: frozenset) -> list:
+        """Returns the homework of a module that has not been submitted, in module order.
+        """
+        return [hwork for hwork in self.module_hw[m_id] if hwork not in submitted_hw]
+
+
+def load_module_index(modules_file_path: str) -> ModuleIndex:
+    """Loads the module index for a modules file, reusing it until the file changes.
+    """
+    mtime = os.stat(modules_file_path).st_mtime_ns
+    cached = _index_cache.get(modules_file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(modules_file_path, "r") as fin:
+        index = ModuleIndex(json.load(fin))
+    _index_cache[modules_file_path] = (mtime, index)
+    return index
@@ -0,0 +1,138 @@
+import io
+import json
+import mmap
+import os
+import struct
+
+from tester.build.template import count_lines, read_option_lines
+from tester.config import Config
+
+BUNDLE_MAGIC = b"TQB1"
+BUNDLE_PREFIX = struct.Struct("<4sI")  # Magic and the length of the JSON header
+
+
+def pack_questions(config: Config, bundle_path: str) -> int:
+    """Packs every question option and solution into a single indexed bundle file.
+
+    The bundle starts with a JSON header mapping each option, relative to the questions
+    directory, to the offsets and lengths of its text and solution in the data that follows, along
+    with its line footprint and the size and modification time of its source files.
+
+    Returns the number of options packed.
+    """
+    index = {}
+    chunks = []
+    offset = 0
+    for question in config.get_questions().values():
+        for option_path in sorted(question["options"]):
+            solution_path = config.get_solution_path(option_path)
+            entry = {"source": _get_source_stamp([option_path, solution_path])}
+            with open(option_path, "rb") as fin:
+                option_data = fin.read()
+            entry["option"] = [offset, len(option_data)]
+            entry["line_count"] = count_lines(_split_lines(option_data))
+            chunks.append(option_data)
+            offset += len(option_data)
+            entry["solution"] = None
+            if os.path.exists(solution_path):
+                with open(solution_path, "rb") as fin:
+                    solution_data = fin.read()
+                entry["solution"] = [offset, len(solution_data)]
+                chunks.append(solution_data)
+                offset += len(solution_data)
+            index[os.path.relpath(option_path, config.questions_dir_path)] = entry
+
+    header = json.dumps({"options": index}, sort_keys=True).encode()
+    partial_path = f"{bundle_path}.{os.getpid()}.part"
+    os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+    with open(partial_path, "wb") as fout:
+        fout.write(BUNDLE_PREFIX.pack(BUNDLE_MAGIC, len(header)))
+        fout.write(header)
+        for chunk in chunks:
+            fout.write(chunk)
+    os.replace(partial_path, bundle_path)
+    return len(index)
+
+
+def _split_lines(data) -> list:
+    """Splits packed text into lines the way reading its source file does, with universal newlines.
+    """
+    return io.StringIO(str(data, "utf-8"), newline=None).readlines()
+
+
+def _get_source_stamp(paths: list) -> list:
+    """Returns the size and modification time of each path, or None for missing paths.
+    """
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append([stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            stamp.append(None)
+    return stamp
+
+
+class QuestionBundle():
+    """A packed question pool, memory-mapped so reads are slices of shared pages.
+
+    Options whose source files changed since packing are dropped from the index when the bundle is
+    opened, and read from disk instead.
+    """
+    def __init__(self, bundle_path: str, config: Config):
+        self.config = config
+        with open(bundle_path, "rb") as fin:
+            self._map = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = BUNDLE_PREFIX.unpack_from(self._map)
+        if magic != BUNDLE_MAGIC:
+            raise InvalidQuestionBundleError(f"'{bundle_path}' is not a question bundle.")
+        header_end = BUNDLE_PREFIX.size + header_length
+        index = json.loads(self._map[BUNDLE_PREFIX.size:header_end])["options"]
+        self.index = {}
+        for option_key, entry in index.items():
+            option_path = os.path.join(config.questions_dir_path, option_key)
+            solution_path = config.get_solution_path(option_path)
+            if _get_source_stamp([option_path, solution_path]) == entry["source"]:
+                self.index[option_key] = entry
+        self._data = memoryview(self._map)[header_end:]
+
+    def _get_entry(self, option_path: str) -> dict:
+        """Returns the index entry of an option, or None if it isn't packed or is out of date.
+        """
+        return self.index.get(os.path.relpath(option_path, self.config.questions_dir_path))
+
+    def _slice(self, location: list) -> memoryview:
+        offset, length = location
+        return self._data[offset:offset + length]
+
+    def read_option_lines(self, option_path: str) -> list:
+        entry = self._get_entry(option_path)
+        if entry is None:
+            return read_option_lines(option_path)
+        return _split_lines(self._slice(entry["option"]))
+
+    def read_solution_lines(self, option_path: str) -> list:
+        entry = self._get_entry(option_path)
+        if entry is None or entry["solution"] is None:
+            return read_option_lines(self.config.get_solution_path(option_path))
+        return _split_lines(self._slice(entry["solution"]))
+
+    def get_line_count(self, option_path: str) -> int:
+        """Returns the packed line footprint of an option, or None if it isn't packed or is out of
+        date.
+        """
+        entry = self._get_entry(option_path)
+        return entry["line_count"] if entry else None
+
+
+def open_question_bundle(config: Config) -> QuestionBundle:
+    """Opens the active course's question bundle, or returns None if it hasn't been packed.
+    """
+    bundle_path = os.path.join(config.cache_dir_path, config.question_bundle_file_name)
+    if not os.path.exists(bundle_path):
+        return None
+    return QuestionBundle(bundle_path, config)
+
+
+class InvalidQuestionBundleError(Exception):
+    pass
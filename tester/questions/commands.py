@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+
+import click
+import parmap
+from markdown2 import markdown
+
+from tester.build.template import MAX_LINES, count_lines
+from tester.config import Config
+from tester.questions.bundle import pack_questions
+
+
+@click.group()
+@click.pass_context
+def questions(ctx):
+    """Inspect the question pool of the active course.
+    """
+    pass
+
+
+def _hash_option(option_path: str, solution_path: str) -> str:
+    """Hashes the content of a question option together with its solution.
+    """
+    option_hash = hashlib.sha256()
+    for path in (option_path, solution_path):
+        if os.path.exists(path):
+            with open(path, "rb") as fin:
+                option_hash.update(fin.read())
+        option_hash.update(b"\0")
+    return option_hash.hexdigest()
+
+
+def _check_option(option_path: str, solution_path: str) -> dict:
+    """Validates a single question option and measures its footprint on the page.
+    """
+    errors = []
+    warnings = []
+    line_count = 0
+    with open(option_path, "r") as fin:
+        question_lines = fin.readlines()
+    if not "".join(question_lines).strip():
+        errors.append("question has no content")
+    else:
+        line_count = count_lines(question_lines)
+        if line_count > MAX_LINES:
+            warnings.append(f"question takes {line_count} lines, more than a page ({MAX_LINES})")
+        try:
+            markdown("".join(question_lines), extras=["tables"])
+        except Exception as e:
+            errors.append(f"question markdown does not render: {e}")
+
+    if not os.path.exists(solution_path):
+        errors.append(f"missing solution '{os.path.basename(solution_path)}'")
+    else:
+        with open(solution_path, "r") as fin:
+            solution_content = fin.read()
+        if not solution_content.strip():
+            errors.append("solution has no content")
+        else:
+            try:
+                markdown(solution_content, extras=["tables"])
+            except Exception as e:
+                errors.append(f"solution markdown does not render: {e}")
+
+    return {"errors": errors, "warnings": warnings, "line_count": line_count}
+
+
+def _find_numbering_gaps(numbers: list) -> list:
+    """Returns the numbers missing from an otherwise consecutive run.
+    """
+    if not numbers:
+        return []
+    return sorted(set(range(min(numbers), max(numbers) + 1)) - set(numbers))
+
+
+def _get_pool_problems(config: Config) -> tuple:
+    """Checks the layout of the question pool without reading any question content.
+
+    Returns the problems found and the option paths that need checking.
+    """
+    problems = []
+    option_paths = []
+    # Keep the names as found, since zero padded names like "01" are allowed
+    q_names = sorted(
+        (q for q in os.listdir(config.questions_dir_path) if config.question_dir_pattern.match(q)),
+        key=int
+    )
+    for missing in _find_numbering_gaps([int(q) for q in q_names]):
+        problems.append(f"Question folder {missing} is missing")
+    for q_name in q_names:
+        q_num = int(q_name)
+        q_path = os.path.join(config.questions_dir_path, q_name)
+        o_names = [o for o in os.listdir(q_path) if config.question_file_pattern.match(o)]
+        if not o_names:
+            problems.append(f"Question {q_num} has no options")
+        o_names.sort(key=lambda o: int(os.path.splitext(o)[0]))
+        o_nums = [int(os.path.splitext(o)[0]) for o in o_names]
+        for missing in _find_numbering_gaps(o_nums):
+            problems.append(f"Question {q_num} is missing option {missing}")
+        option_paths.extend(os.path.join(q_path, o_name) for o_name in o_names)
+    return problems, option_paths
+
+
+@questions.command("check")
+@click.option("--no-cache", is_flag=True, default=False,
+              help="Check every option again instead of reusing earlier results.")
+@click.option("--verbose", is_flag=True, default=False,
+              help="Print the line footprint of every option.")
+@click.pass_obj
+def check(config: Config, no_cache: bool, verbose: bool):
+    """Validates every question option in the active course's pool.
+    """
+    problems, option_paths = _get_pool_problems(config)
+
+    cache_path = os.path.join(config.cache_dir_path, config.question_check_cache_file_name)
+    cache = {}
+    if os.path.exists(cache_path) and not no_cache:
+        with open(cache_path, "r") as fin:
+            cache = json.load(fin)
+
+    results = {}
+    options_to_check = []
+    option_hashes = {}
+    for option_path in option_paths:
+        option_key = os.path.relpath(option_path, config.questions_dir_path)
+        solution_path = config.get_solution_path(option_path)
+        option_hashes[option_key] = _hash_option(option_path, solution_path)
+        cached = cache.get(option_key)
+        if cached and cached["hash"] == option_hashes[option_key]:
+            results[option_key] = cached["result"]
+        else:
+            options_to_check.append((option_key, option_path, solution_path))
+
+    if options_to_check:
+        print(f": Checking {len(options_to_check)} of {len(option_paths)} options...")
+        checked = parmap.starmap(
+            _check_option,
+            [(option_path, solution_path) for _, option_path, solution_path in options_to_check],
+            pm_pbar=True
+        )
+        for (option_key, _, _), result in zip(options_to_check, checked):
+            results[option_key] = result
+
+    os.makedirs(config.cache_dir_path, exist_ok=True)
+    with open(cache_path, "w") as fout:
+        json.dump(
+            {k: {"hash": option_hashes[k], "result": r} for k, r in results.items()},
+            fout,
+            indent=config.json_indent,
+            sort_keys=True
+        )
+
+    warning_count = 0
+    for option_key in sorted(results, key=lambda k: [int(p) for p in k[:-3].split(os.sep)]):
+        result = results[option_key]
+        if verbose:
+            print(f"  {option_key}: {result['line_count']} lines")
+        for error in result["errors"]:
+            problems.append(f"{option_key}: {error}")
+        for warning in result["warnings"]:
+            print(f"? {option_key}: {warning}")
+            warning_count += 1
+    for problem in problems:
+        print(f"! {problem}")
+
+    print(f": {len(option_paths)} options checked, {len(problems)} problems, "
+          f"{warning_count} warnings.")
+    if problems:
+        raise InvalidQuestionPoolError(f"{len(problems)} problems found in the question pool.")
+
+
+@questions.command("pack")
+@click.pass_obj
+def pack(config: Config):
+    """Packs the question pool into a single memory-mapped bundle for builds to read.
+
+    Builds use the bundle whenever it exists, reading any option edited since packing from disk.
+    """
+    bundle_path = os.path.join(config.cache_dir_path, config.question_bundle_file_name)
+    option_count = pack_questions(config, bundle_path)
+    bundle_size = os.path.getsize(bundle_path)
+    print(f": Packed {option_count} options into '{bundle_path}' ({bundle_size} bytes).")
+
+
+class InvalidQuestionPoolError(Exception):
+    pass
@@ -1,9 +1,16 @@
 import click
 import datetime
-import math
 import numpy as np
+import os
+import tqdm
 
+from tester.api import get_questions, grade_student
+from tester.build.pipeline import MIN_FREE_MEMORY, RENDER_RETRIES, RENDER_TIMEOUT, render_tests
+from tester.build.render import AdaptiveJobRunner
 from tester.config import Config
+from tester.mail import get_email, send_emails
+from tester.report.forecast import forecast_questions
+from tester.report.progress import get_report_content
 
 
 @click.group()
@@ -14,60 +21,66 @@ def report(ctx):
     pass
 
 
-def get_grade(student, modules, all_module_questons, question_limit, verbose=False):
-    """Returns the grade for an individual student.
+def get_grade(student, module_index, question_limit, verbose=False):
+    """Prints and returns the grade for an individual student.
     """
-    points_removed = []
-    student_answered = [a for l in student["answered"].values() for a in l]
-    for module in modules.values():
-        q_count = len(module["questions"])
-        hw_count = len(module["hw"])
-        for hwork in module["hw"]:
-            if hwork in student["hw"]:
-                continue  # Student did the HW, they get any test questions points they have
-            # Deduct points
-            if verbose:
-                print("  ! Homework {} Not Submitted".format(hwork))
-            max_questions_to_remove = math.ceil(q_count / hw_count)
-            points_lost_count = 0
-            if verbose:
-                print("    Questions lost: ", end="")
-            for i in module["questions"]:
-                if i in student_answered and i not in points_removed:
-                    points_removed.append(i)
-                    points_lost_count += 1
-                    if verbose:
-                        print("{} ".format(i), end="")
-                if points_lost_count >= max_questions_to_remove:
-                    break
-            if points_lost_count <= 0 and verbose:
+    result = grade_student(student, module_index, question_limit)
+    if verbose:
+        for _, hwork, questions_lost in result.missing_hw:
+            print("  ! Homework {} Not Submitted".format(hwork))
+            print("    Questions lost: ", end="")
+            for i in questions_lost:
+                print("{} ".format(i), end="")
+            if not questions_lost:
                 print("n/a (no questions answered in module yet)")
-            elif verbose:
+            else:
                 print()
+        print("  Questions answered:              ", student.answered_count)
+        print("  Points lost due to incomplete HW:", len(result.points_lost))
+        print("  Points after HW deductions:      ", result.answered_count)
+        print("  Bonus points:                    ", student.bonus)
+        print("  Penalty points:                  ", student.penalty)
 
-    answered = []
-    for answered_q in student_answered:
-        if answered_q in all_module_questons and answered_q not in points_removed:
-            answered.append(answered_q)
+    print("  Final points:                     {}/{}".format(result.points, question_limit))
+    print("  Final grade:                      {:.2f}%".format(result.grade))
 
-    if verbose:
-        print("  Questions answered:              ", len(student_answered))
-        print("  Points lost due to incomplete HW:", len(points_removed))
-        print("  Points after HW deductions:      ", len(answered))
-        print("  Bonus points:                    ", student["bonus"])
-        print("  Penalty points:                  ", student["penalty"])
+    return result.points, result.grade
 
-    points = len(answered) + student["bonus"] - student["penalty"]
-    points = points if points <= question_limit else question_limit
-    grade = points / question_limit
-    grade = grade * 100
-    grade = 100.0 if grade > 100.0 else grade
-    grade = 0.0 if grade < 0.0 else grade
 
-    print("  Final points:                     {}/{}".format(points, question_limit))
-    print("  Final grade:                      {:.2f}%".format(grade))
+def _build_grade_reports(config: Config, students: list, module_index, question_limit: int,
+                         as_of: str, report_name: str, jobs: int, email: bool):
+    """Renders a grade report for each student in parallel, and optionally emails them.
+    """
+    report_name = report_name or f"grades-{datetime.date.today()}"
+    output_path = os.path.join(config.active_course_path, config.reports_dir_name, report_name)
+    os.makedirs(output_path, exist_ok=True)
+    all_report_data = []
+    for student in students:
+        result = grade_student(student, module_index, question_limit)
+        report_content = get_report_content(result, question_limit, as_of)
+        all_report_data.append((config, output_path, report_name, student, report_content, False))
+    runner = AdaptiveJobRunner(processes=jobs, timeout=RENDER_TIMEOUT, retries=RENDER_RETRIES,
+                               min_free_memory=MIN_FREE_MEMORY * 1024 * 1024)
+    results, failures = render_tests(all_report_data, "pdf", runner)
+    print(f": {len(results)} grade reports written to '{output_path}'")
+    for sid, error in sorted(failures.items()):
+        print(f"! Report for {sid} failed to build: {error}")
 
-    return points, grade
+    if email:
+        instructor_email = config.context["instructor_email"]
+        subject = f"{config.context['active_course']}: Grade Report"
+        outgoing = []
+        print("Building grade report emails...")
+        for student, report_path in tqdm.tqdm(results):
+            outgoing.append(get_email(
+                to_email=student.email,
+                from_email=instructor_email,
+                subject=subject,
+                attachment_path=report_path,
+                body_path=config.report_email_body_file_path,
+                cc_email=instructor_email
+            ))
+        send_emails(config, outgoing, "grade reports")
 
 
 @report.command("grades")
@@ -77,18 +90,32 @@ def get_grade(student, modules, all_module_questons, question_limit, verbose=Fal
 @click.option("--grade-dist", is_flag=True, default=False)
 @click.option("--lower-lim", default=0.0, type=float)
 @click.option("--verbose", is_flag=True, default=False)
+@click.option("--as-of", default=None,
+              help="Grade students as they were right after changes for the named quiz.")
+@click.option("--per-student-pdf", is_flag=True, default=False,
+              help="Render each student's grade breakdown to a PDF instead of printing it.")
+@click.option("--email", is_flag=True, default=False,
+              help="With --per-student-pdf, send each student their grade report via email.")
+@click.option("--report-name", default=None,
+              help="With --per-student-pdf, the directory to write reports into under _reports/ "
+                   "(defaults to today's date).")
+@click.option("--jobs", default=None, type=int,
+              help="With --per-student-pdf, the most reports to render at once.")
 @click.pass_obj
 def grades(config: Config, question_limit: int, sid: str, name: str, grade_dist: bool,
-           lower_lim: float, verbose: bool):
+           lower_lim: float, verbose: bool, as_of: str, per_student_pdf: bool, email: bool,
+           report_name: str, jobs: int):
     """Prints out a report of student progress.
     """
-    modules = config.get_modules()
-    students = config.get_students()
-    all_module_questions = {q for m in modules.values() for q in m["questions"]}
+    if email and not per_student_pdf:
+        print("! Only grade reports built with --per-student-pdf can be emailed.")
+        return
+    module_index = config.get_module_index()
+    students = config.get_students(as_of=as_of)
     if not question_limit:
-        question_limit = len(all_module_questions)  # TODO: this should maybe be max()
+        question_limit = module_index.question_limit  # TODO: this should maybe be max()
 
-    students = sorted(list(students.values()), key=lambda k: k["last_name"])
+    students = sorted(list(students.values()), key=lambda k: k.last_name)
     if not students:
         print("! No students found!")
         return
@@ -96,21 +123,24 @@ def grades(config: Config, question_limit: int, sid: str, name: str, grade_dist:
         name = name.lower()
         students = [
             s for s in students
-            if name in s["first_name"].lower() or name in s["last_name"].lower()
+            if name in s.first_name.lower() or name in s.last_name.lower()
         ]
     elif sid:
-        students = [s for s in students if s["id"] == sid]
+        students = [s for s in students if s.id == sid]
     if not students:
         print(f"! No student(s) found!")
         return
+    if per_student_pdf:
+        _build_grade_reports(config, students, module_index, question_limit, as_of, report_name,
+                             jobs, email)
+        return
     n_students = len(students)
     grades = []
     for student in students:
-        print("\nGRADE REPORT for {} {}".format(student["first_name"], student["last_name"]))
+        print("\nGRADE REPORT for {} {}".format(student.first_name, student.last_name))
         _, grade = get_grade(
             student,
-            modules,
-            all_module_questions,
+            module_index,
             question_limit,
             verbose=verbose
         )
@@ -142,17 +172,15 @@ def grades(config: Config, question_limit: int, sid: str, name: str, grade_dist:
 @report.command("summary")
 @click.pass_obj
 def summary(config: Config):
-    modules = config.get_modules()
+    module_index = config.get_module_index()
     students = config.get_students()
-    students = sorted(list(students.values()), key=lambda k: k["last_name"])
+    students = sorted(list(students.values()), key=lambda k: k.last_name)
     student_count = len(students)
-    all_module_questions = {q for m in modules.values() for q in m["questions"]}
-    question_limit = len(all_module_questions)
+    question_limit = module_index.question_limit
 
     total_answered = 0
     for student in students:
-        student_answered = [a for l in student["answered"].values() for a in l]
-        total_student_answered = len(student_answered)  # - student["penalty"] + student["bonus"]
+        total_student_answered = student.answered_count  # - student.penalty + student.bonus
         total_answered += total_student_answered
     average_answered = total_answered / student_count
     print(f"Average questions answered per student: {average_answered:.2f} out of {question_limit}")
@@ -165,15 +193,14 @@ def quiz_history(config: Config):
     from matplotlib.ticker import (MultipleLocator, FormatStrFormatter,
                                    AutoMinorLocator)
 
-    modules = config.get_modules()
+    module_index = config.get_module_index()
     students = config.get_students()
-    students = sorted(list(students.values()), key=lambda k: k["last_name"])
+    students = sorted(list(students.values()), key=lambda k: k.last_name)
     student_count = len(students)
-    all_module_questions = {q for m in modules.values() for q in m["questions"]}
-    question_limit = len(all_module_questions)
+    question_limit = module_index.question_limit
     quiz_occurrences = []
     for s in students:
-        for w in s["answered"].keys():
+        for w in s.answered.keys():
             quiz_occurrences.append(w)
     quiz_occurrences = sorted(list(set(quiz_occurrences)))
     avg_points_per_quiz_occurrence = {}
@@ -181,8 +208,8 @@ def quiz_history(config: Config):
         students_participating = 0
         avg_points_per_quiz_occurrence[q] = 0
         for s in students:
-            if q in s["answered"]:
-                avg_points_per_quiz_occurrence[q] += len(s["answered"][q])
+            if q in s.answered:
+                avg_points_per_quiz_occurrence[q] += len(s.answered[q])
                 students_participating += 1
         if students_participating > 0:
             avg_points_per_quiz_occurrence[q] /= students_participating
@@ -206,9 +233,96 @@ def quiz_history(config: Config):
     plt.show()
 
 
+def _parse_question_rates(question_rates: tuple) -> dict:
+    """Parses per-question pass rates given as "NUM=RATE".
+    """
+    rates = {}
+    for question_rate in question_rates:
+        try:
+            q_num, rate = question_rate.split("=")
+            rates[int(q_num)] = float(rate)
+        except ValueError:
+            raise InvalidPassRateError(f"Question pass rate '{question_rate}' should look like "
+                                       "'NUM=RATE', e.g. '42=0.3'.")
+        if not 0.0 <= rates[int(q_num)] <= 1.0:
+            raise InvalidPassRateError(f"Pass rate for question {q_num} must be between 0 and 1.")
+    return rates
+
+
+@report.command("forecast")
+@click.option("--quizzes", default=4, type=click.IntRange(min=1),
+              help="The number of upcoming quizzes to simulate.")
+@click.option("--pass-rate", default=0.7, type=click.FloatRange(0.0, 1.0),
+              help="The assumed chance of a student passing a question they are given.")
+@click.option("--question-rate", "question_rates", multiple=True,
+              help="The pass rate of one question, given as 'NUM=RATE'. May be repeated.")
+@click.option("--max-question", default=None, type=int,
+              help="The maximum question number that may appear on a test.")
+@click.option("--max-questions", default=None, type=int,
+              help="The maximum number of questions that may appear on a test.")
+@click.option("--seed", default=None, type=int, help="Seeds the simulation for repeatable runs.")
+@click.option("--per-student", is_flag=True, default=False,
+              help="List the quiz each student runs out of questions instead of question demand.")
+@click.option("--format", "output_format", default="table", type=click.Choice(["table", "csv"]),
+              help="The output format.")
+@click.pass_obj
+def forecast(config: Config, quizzes: int, pass_rate: float, question_rates: tuple,
+             max_question: int, max_questions: int, seed: int, per_student: bool,
+             output_format: str):
+    """Forecasts how many students get each question over the next quizzes.
+
+    Every student's tests are selected the same way as when building, and each question is
+    passed at random with its assumed pass rate before the next quiz is selected.
+    """
+    students = sorted(config.get_students().values(), key=lambda k: (k.last_name, k.id))
+    if not students:
+        print("! No students found!")
+        return
+    questions = get_questions(config, max_question)
+    result = forecast_questions(students, questions, quizzes, pass_rate,
+                                _parse_question_rates(question_rates), max_questions, seed)
+
+    if per_student:
+        headers = ["ID", "Name", "Out of questions"]
+        rows = [
+            [s.id, f"{s.first_name} {s.last_name}", str(run_out) if run_out else "-"]
+            for s, run_out in zip(students, result.run_out.tolist())
+        ]
+    else:
+        headers = ["Question"] + [f"Quiz {i}" for i in range(1, quizzes + 1)]
+        rows = [
+            [str(q_num)] + [str(n) for n in column]
+            for q_num, column in zip(result.question_nums, result.demand.T.tolist())
+        ]
+        rows.append(["Short tests"] + [str(n) for n in result.short.tolist()])
+        rows.append(["No questions"] + [
+            str(n) for n in np.cumsum(np.bincount(result.run_out, minlength=quizzes + 1)[1:])
+        ])
+
+    if output_format == "csv":
+        print("\n".join(",".join(row) for row in [headers] + rows))
+        return
+    widths = [max(len(row[i]) for row in [headers] + rows) for i in range(len(headers))]
+    bar = "=" * (sum(widths) + 2 * (len(widths) - 1))
+    lines = [f": Forecast of {quizzes} quizzes for {len(students)} students "
+             f"at a {pass_rate:.0%} pass rate"]
+    lines.append("  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip())
+    lines.append(bar)
+    for row in rows:
+        lines.append("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+    lines.append(bar)
+    run_out_count = np.count_nonzero(result.run_out)
+    lines.append(f": {run_out_count} students run out of questions within {quizzes} quizzes.")
+    print("\n".join(lines))
+
+
 class InvalidStudentIdError(Exception):
     pass
 
 
 class StudentIdAlreadyExistsError(Exception):
     pass
+
+
+class InvalidPassRateError(Exception):
+    pass
@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+import numpy as np
+
+Forecast = namedtuple("Forecast", [
+    "question_nums",  # Question numbers, in the order of the demand columns
+    "demand",  # Number of students given each question, one row per quiz
+    "short",  # Number of students given fewer questions than their maximum, per quiz
+    "run_out",  # The first quiz each student would get no questions on, or 0 if none
+])
+
+
+def get_availability(students: list, question_nums: np.ndarray) -> np.ndarray:
+    """Returns a students by questions matrix of which questions each student may still get.
+    """
+    rows = []
+    cols = []
+    for row, student in enumerate(students):
+        blocked = list(student.all_answered | student.disallowed)
+        rows.extend([row] * len(blocked))
+        cols.extend(blocked)
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    positions = np.searchsorted(question_nums, cols)
+    in_pool = positions < len(question_nums)
+    in_pool[in_pool] = question_nums[positions[in_pool]] == cols[in_pool]
+    available = np.ones((len(students), len(question_nums)), dtype=bool)
+    available[rows[in_pool], positions[in_pool]] = False
+    return available
+
+
+def select_next(available: np.ndarray, max_questions: np.ndarray) -> np.ndarray:
+    """Selects each student's next questions: the lowest numbered ones still available to them.
+
+    Matches the selection of tests when building, for every student at once.
+    """
+    return available & (np.cumsum(available, axis=1) <= max_questions[:, None])
+
+
+def simulate(available: np.ndarray, max_questions: np.ndarray, pass_rates: np.ndarray,
+             quizzes: int, rng: np.random.Generator) -> tuple:
+    """Simulates the next quizzes, passing each selected question with its pass rate.
+
+    Returns the per-quiz question demand, the per-quiz count of short tests and each student's
+    run out quiz.
+    """
+    available = available.copy()
+    demand = np.zeros((quizzes, available.shape[1]), dtype=np.int64)
+    short = np.zeros(quizzes, dtype=np.int64)
+    run_out = np.zeros(available.shape[0], dtype=np.int64)
+    for quiz in range(quizzes):
+        selected = select_next(available, max_questions)
+        demand[quiz] = selected.sum(axis=0)
+        selected_counts = selected.sum(axis=1)
+        short[quiz] = np.count_nonzero((selected_counts > 0) & (selected_counts < max_questions))
+        run_out[(selected_counts == 0) & (run_out == 0)] = quiz + 1
+        available &= ~(selected & (rng.random(selected.shape) < pass_rates))
+    return demand, short, run_out
+
+
+def forecast_questions(students: list, questions: dict, quizzes: int, pass_rate: float,
+                       question_rates: dict = None, max_questions: int = None,
+                       seed: int = None) -> Forecast:
+    """Forecasts question demand over the next quizzes for a roster of students.
+
+    Each question is passed with the given rate, unless it has its own rate in `question_rates`.
+    """
+    question_nums = np.array(sorted(questions), dtype=np.intp)
+    pass_rates = np.full(len(question_nums), pass_rate, dtype=float)
+    for q_num, rate in (question_rates or {}).items():
+        pass_rates[question_nums == q_num] = rate
+    student_max_questions = np.array(
+        [max_questions or s.max_questions for s in students], dtype=np.int64
+    )
+    available = get_availability(students, question_nums)
+    demand, short, run_out = simulate(available, student_max_questions, pass_rates, quizzes,
+                                      np.random.default_rng(seed))
+    return Forecast(question_nums.tolist(), demand, short, run_out)
@@ -0,0 +1,42 @@
+from tester.build.template import NAME_BLOCK
+
+REPORT_HEADER = "# Grade Report{}\n\n"
+
+
+def get_report_content(result, question_limit: int, as_of: str = None) -> str:
+    """Assembles the markdown grade breakdown of a student from their grade result.
+    """
+    student = result.student
+    parts = [
+        REPORT_HEADER.format(f" as of {as_of}" if as_of else ""),
+        NAME_BLOCK.format(student.first_name, student.last_name, student.id, student.section)
+    ]
+
+    parts.append("## Questions Answered\n\n")
+    if student.answered:
+        parts.append("| Quiz | Questions |\n|---|---|\n")
+        for quiz, q_nums in student.answered.items():
+            parts.append("| {} | {} |\n".format(quiz, ", ".join(str(q) for q in q_nums)))
+        parts.append("\n")
+    else:
+        parts.append("No questions answered yet.\n\n")
+
+    if result.missing_hw:
+        parts.append("## Missing Homework\n\n| Homework | Questions Lost |\n|---|---|\n")
+        for _, hwork, questions_lost in result.missing_hw:
+            lost = ", ".join(str(q) for q in questions_lost) or "n/a"
+            parts.append("| {} | {} |\n".format(hwork, lost))
+        parts.append("\n")
+
+    parts.append("## Grade\n\n| | |\n|---|---|\n")
+    for label, value in [
+        ("Questions answered", student.answered_count),
+        ("Points lost due to incomplete HW", len(result.points_lost)),
+        ("Points after HW deductions", result.answered_count),
+        ("Bonus points", student.bonus),
+        ("Penalty points", student.penalty),
+        ("Final points", f"{result.points}/{question_limit}"),
+        ("Final grade", f"{result.grade:.2f}%"),
+    ]:
+        parts.append(f"| {label} | {value} |\n")
+    return "".join(parts)
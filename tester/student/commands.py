@@ -1,7 +1,21 @@
 import click
 import csv
+import io
+import json
 
-from tester.config import Config
+from tester.api import apply_answered_csv, apply_results
+from tester.api import import_students as import_students_csv
+from tester.config import STUDENT_INDEX_FIELDS, Config
+from tester.student.model import Student
+
+LIST_COLUMNS = {
+    "first_name": "First Name",
+    "last_name": "Last Name",
+    "id": "ID",
+    "section": "Section",
+    "email": "Email",
+    "username": "Username",
+}
 
 
 @click.group()
@@ -18,107 +32,80 @@ def student(ctx):
 def import_students(config: Config, path_to_csv_file):
     """Imports students from a CSV file, updating any existing ones.
     """
-    id_key = "id"
-    students = config.get_students()
-    with open(path_to_csv_file, "r", encoding="utf-8-sig") as csvfile:
-        # TODO: validate CSV format
-        reader = csv.reader(csvfile, delimiter=",")
-        headers = list(next(reader, None))
-        headers = [h.lower().strip() for h in headers]
-        headers = [h.replace(" ", "_") for h in headers]
-        for row in reader:
-            new_student = {}
-            for i, h in enumerate(headers):
-                new_student[h] = row[i].strip()
-
-            # Ensure other keys exist
-            if "answered" not in new_student:
-                new_student["answered"] = {}
-            if "bonus" not in new_student:
-                new_student["bonus"] = 0
-            if "penalty" not in new_student:
-                new_student["penalty"] = 0
-            if "disallowed" not in new_student:
-                new_student["disallowed"] = []
-            if "hw" not in new_student:
-                new_student["hw"] = []
-            if "max_questions" not in new_student:
-                new_student["max_questions"] = 8
-
-            if new_student[id_key] in students:
-                students[new_student[id_key]].update(new_student)
-            else:
-                students[new_student[id_key]] = new_student
-
-    config.save_students(students)
+    import_students_csv(config, path_to_csv_file)
 
 
 @student.command("list")
+@click.option("--section", default=None, help="Only list students in the given section.")
+@click.option("--search", default=None,
+              help="Only list students whose ID, name, email or username contains this text.")
+@click.option("--sort", "sort_key", default="last_name", type=click.Choice(LIST_COLUMNS.keys()),
+              help="The field to sort students by.")
+@click.option("--limit", default=None, type=int, help="The maximum number of students to list.")
+@click.option("--offset", default=0, type=int, help="The number of matching students to skip.")
+@click.option("--format", "output_format", default="table",
+              type=click.Choice(["table", "csv", "json"]), help="The output format.")
+@click.option("--as-of", default=None,
+              help="List the students as they were right after changes for the named quiz.")
 @click.pass_obj
-def list_students(config: Config):
+def list_students(config: Config, section: str, search: str, sort_key: str, limit: int,
+                  offset: int, output_format: str, as_of: str):
     """Prints out the list students in the active course.
     """
-    students = config.get_students()
+    if as_of:
+        students = [
+            {f: getattr(s, f) for f in STUDENT_INDEX_FIELDS}
+            for s in config.get_students(as_of=as_of).values()
+        ]
+    else:
+        students = config.get_students_index()
     if not students:
         print(": No students in course")
         return
-    students = sorted(list(students.values()), key=lambda k: k["last_name"])
-    # Calculate lengths
-    more_text = ".."
-    more_text_len = len(more_text)
-    f_name_max = max(len(s["first_name"]) for s in students)
-    l_name_max = max(len(s["last_name"]) for s in students)
-    s_id_max = max(len(s["id"]) for s in students)
-    email_max = max(len(s["email"]) for s in students)
-    username_max = max(len(s["username"]) for s in students)
-    f_name_max_more = f_name_max + more_text_len
-    l_name_max_more = l_name_max + more_text_len
-    s_id_max_more = s_id_max + more_text_len
-    email_max_more = email_max + more_text_len
-    username_max_more = username_max + more_text_len
-    total_width = f_name_max_more + l_name_max_more + s_id_max_more + email_max_more + \
-        username_max_more + username_max_more
-    bar = "=" * total_width
-    # Print course
-    active_course = config.context["active_course"]
-    print(f": Listing students for course '{active_course}'")
-    # Print header
-    header = "{}  {}  {}  {}  {}".format(
-        "First Name".ljust(f_name_max+2),
-        "Last Name".ljust(l_name_max+2),
-        "ID".ljust(s_id_max+2),
-        "Email".ljust(email_max+2),
-        "Username".ljust(username_max+2),
-    )
-    print(header)
-    print(bar)
-    # Print students
+    student_count = len(students)
+    if section:
+        students = [s for s in students if s["section"] == section]
+    if search:
+        search = search.lower()
+        search_keys = ["id", "first_name", "last_name", "email", "username"]
+        students = [s for s in students if any(search in s[k].lower() for k in search_keys)]
+    students.sort(key=lambda k: (k[sort_key], k["last_name"], k["first_name"]))
+    match_count = len(students)
+    students = students[offset:offset + limit if limit is not None else None]
+
+    if output_format == "json":
+        print(json.dumps(students, indent=config.json_indent))
+        return
+    if output_format == "csv":
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=list(LIST_COLUMNS.keys()),
+                                extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(students)
+        print(output.getvalue(), end="")
+        return
+
+    # Calculate column widths in a single pass
+    widths = {k: len(title) for k, title in LIST_COLUMNS.items()}
+    for s in students:
+        for k in widths:
+            widths[k] = max(widths[k], len(s[k]))
+    bar = "=" * (sum(widths.values()) + 2 * (len(widths) - 1))
+    lines = [f": Listing students for course '{config.context['active_course']}'"]
+    lines.append("  ".join(title.ljust(widths[k]) for k, title in LIST_COLUMNS.items()))
+    lines.append(bar)
     for s in students:
-        f_name = (s["first_name"][:f_name_max] + "..") \
-            if len(s["first_name"]) > f_name_max_more \
-            else s["first_name"]
-        l_name = (s["last_name"][:l_name_max] + "..") \
-            if len(s["last_name"]) > l_name_max_more \
-            else s["last_name"]
-        s_id = (s["id"][:s_id_max] + "..") \
-            if len(s["id"]) > s_id_max_more \
-            else s["id"]
-        email = (s["email"][:email_max] + "..") \
-            if len(s["email"]) > email_max_more \
-            else s["email"]
-        username = (s["username"][:username_max] + "..") \
-            if len(s["username"]) > username_max_more \
-            else s["username"]
-        line = "{}  {}  {}  {}  {}".format(
-            f_name.ljust(f_name_max_more),
-            l_name.ljust(l_name_max_more),
-            s_id.ljust(s_id_max_more),
-            email.ljust(email_max_more),
-            username.ljust(username_max_more),
-        )
-        print(line)
-    print(bar)
-    print(": {} students in the course.".format(len(students)))
+        lines.append("  ".join(s[k].ljust(widths[k]) for k in LIST_COLUMNS).rstrip())
+    lines.append(bar)
+    if match_count == student_count and len(students) == match_count:
+        lines.append(": {} students in the course.".format(student_count))
+    else:
+        lines.append(": Showing {} of {} matching students ({} in the course).".format(
+            len(students),
+            match_count,
+            student_count
+        ))
+    print("\n".join(lines))
 
 
 @student.command("add")
@@ -132,19 +119,14 @@ def list_students(config: Config):
 def add(config: Config, unique_id, first_name, last_name, email, section, username):
     """Adds a new student to the active course.
     """
-    new_student = {
-        "answered": {},
-        "bonus": 0,
-        "disallowed": [],
-        "email": email,
-        "first_name": first_name,
-        "hw": [],
-        "id": unique_id,
-        "last_name": last_name,
-        "max_questions": 8,
-        "section": section,
-        "username": username
-    }
+    new_student = Student(
+        unique_id,
+        first_name=first_name,
+        last_name=last_name,
+        email=email,
+        section=section,
+        username=username
+    )
     students = config.get_students()
     if not unique_id:
         raise InvalidStudentIdError("The provided student ID is invalid.")
@@ -152,7 +134,7 @@ def add(config: Config, unique_id, first_name, last_name, email, section, userna
         raise StudentIdExistsError("A student with that ID already exists.")
     else:
         students[unique_id] = new_student
-    config.save_students(students)
+    config.save_students(students, op="add")
 
     print(": New student added to '{}' course.".format(config.context["active_course"]))
 
@@ -164,25 +146,22 @@ def add(config: Config, unique_id, first_name, last_name, email, section, userna
 def update(config: Config, name: str, path_to_csv_file: str):
     """Updates students' answered questions from a CSV file.
     """
-    students = config.get_students()
-    with open(path_to_csv_file, "r", encoding="utf-8-sig") as csvfile:
-        reader = csv.reader(csvfile, delimiter=",")
-        headers = next(reader, None)
-        for row in reader:
-            row_dict = {}
-            for i, col in enumerate(headers):
-                row_dict[col] = row[i]
+    apply_answered_csv(config, name, path_to_csv_file)
 
-            if not row_dict["answered"]:
-                continue
 
-            sid = row_dict["id"]
-            if name not in students[sid]["answered"]:
-                students[sid]["answered"][name] = []
-            answered = list(map(int, row_dict["answered"].split()))
-            students[sid]["answered"][name].extend(answered)
-            students[sid]["answered"][name] = list(set(students[sid]["answered"][name]))
-    config.save_students(students)
+@student.command("record")
+@click.argument("name")
+@click.argument("path_to_results_file")
+@click.pass_obj
+def record(config: Config, name: str, path_to_results_file: str):
+    """Updates students' answered questions from graded results of a built test.
+
+    Each row of the results file holds a student ID followed by one pass/fail mark per question
+    slot of that student's test (e.g. "1,1,0,1" or "YNYY"), in the order the questions appeared.
+    Marks are matched against the question assignments recorded when the test was built.
+    """
+    updated = apply_results(config, name, path_to_results_file)
+    print(f": Recorded '{name}' results for {len(updated)} students.")
 
 
 @student.command("update_points")
@@ -205,9 +184,9 @@ def update_points(config: Config, path_to_csv_file: str):
             sid = row_dict["id"]
             new_bonus = row_dict[BONUS_KEY]
             new_penalty = row_dict[PENALTY_KEY]
-            students[sid][BONUS_KEY] = abs(int(float(new_bonus))) if new_bonus else 0
-            students[sid][PENALTY_KEY] = abs(int(float(new_penalty))) if new_penalty else 0
-    config.save_students(students)
+            students[sid].bonus = abs(int(float(new_bonus))) if new_bonus else 0
+            students[sid].penalty = abs(int(float(new_penalty))) if new_penalty else 0
+    config.save_students(students, op="update_points")
 
 
 @student.command("set")
@@ -222,12 +201,11 @@ def set_property(config: Config, property: str, value: int, ids: list):
     add_properties = ["hw", "disallowed"]
     property = property.lower()
 
-    def set_property_value(s: dict, p: str, v: int):
-        s[p] = v
+    def set_property_value(s: Student, p: str, v: int):
+        s.set_property(p, v)
 
-    def append_property_value(s: dict, p: str, v: int):
-        if v not in s[p]:
-            s[p].append(v)
+    def append_property_value(s: Student, p: str, v: int):
+        s.set_property(p, s.get_property(p) | {v})
 
     if property in set_properties:
         operation_func = set_property_value
@@ -243,11 +221,11 @@ def set_property(config: Config, property: str, value: int, ids: list):
         students_to_modify = students
 
     for student in students_to_modify.values():
-        if property not in student:
-            raise KeyError(f"Student '{student['id']}' doesn't have the '{property}' property.")
+        if not student.has_property(property):
+            raise KeyError(f"Student '{student.id}' doesn't have the '{property}' property.")
         operation_func(student, property, value)
 
-    # config.save_students(students)
+    config.save_students(students, op="set")
 
 
 @student.command("add_property")
@@ -265,18 +243,27 @@ def add_property(config: Config, property: str, value: str, value_type: str, for
         raise InvalidPropertyValueTypeError(f"Supported value types are: {', '.join(valid_types)}")
     students = config.get_students()
     for sid, s in students.items():
-        if property not in s or force:
+        if not s.has_property(property) or force:
             if value_type == "int":
-                s[property] = int(value)
+                s.set_property(property, int(value))
             elif value_type == "float":
-                s[property] = float(value)
+                s.set_property(property, float(value))
             else:  # string
-                s[property] = value
+                s.set_property(property, value)
         else:
             raise StudentPropertyExistsError(
                 f"Property '{property}' already exists for student ID '{sid}'."
             )
-    # config.save_students(students)
+    config.save_students(students, op="add_property")
+
+
+@student.command("compact")
+@click.pass_obj
+def compact(config: Config):
+    """Folds the journal of student changes into the students file.
+    """
+    config.compact_students()
+    print(": Student journal compacted.")
 
 
 class InvalidStudentIdError(Exception):
@@ -0,0 +1,106 @@
+import datetime
+import json
+import os
+import shutil
+
+
+class StudentJournal():
+    """An append-only log of changes to student records.
+
+    Each record holds the changed fields of one student. The current roster is the students
+    snapshot with the journal replayed over it. Compacting folds the journal into the snapshot and
+    moves its records to the history file. The history, replayed over the base snapshot taken when
+    journaling began, can rebuild the roster as of any recorded point.
+    """
+    def __init__(self, journal_path: str, history_path: str, base_path: str):
+        self.journal_path = journal_path
+        self.history_path = history_path
+        self.base_path = base_path
+        self._size = None
+
+    @staticmethod
+    def _read_records(path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as fin:
+            return [json.loads(line) for line in fin if line.strip()]
+
+    @staticmethod
+    def replay(students: dict, records) -> dict:
+        """Applies journal records to a dictionary of student dictionaries, in place.
+        """
+        for record in records:
+            if record["fields"] is None:
+                students.pop(record["sid"], None)
+            else:
+                students.setdefault(record["sid"], {}).update(record["fields"])
+        return students
+
+    @staticmethod
+    def diff(saved: dict, students: dict, op: str, quiz: str = None) -> list:
+        """Returns the records that turn the saved student dictionaries into the given ones.
+        """
+        time = datetime.datetime.now().isoformat(timespec="seconds")
+        records = []
+        for sid, student in students.items():
+            previous = saved.get(sid)
+            if previous is None:
+                fields = student
+            else:
+                fields = {k: v for k, v in student.items() if previous.get(k) != v}
+            if fields:
+                records.append({"time": time, "op": op, "quiz": quiz, "sid": sid, "fields": fields})
+        for sid in saved.keys() - students.keys():
+            records.append({"time": time, "op": op, "quiz": quiz, "sid": sid, "fields": None})
+        return records
+
+    def read(self) -> list:
+        """Returns the records not yet compacted into the snapshot.
+        """
+        return self._read_records(self.journal_path)
+
+    def size(self) -> int:
+        """Returns the number of bytes of records not yet compacted, checking the file only once.
+        """
+        if self._size is None:
+            self._size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) \
+                else 0
+        return self._size
+
+    def append(self, records: list, snapshot_path: str):
+        """Appends records to the journal, keeping a base snapshot when journaling begins.
+        """
+        if not os.path.exists(self.base_path):
+            shutil.copyfile(snapshot_path, self.base_path)
+        size = self.size()
+        data = "".join(json.dumps(record, sort_keys=True) + "\n" for record in records).encode()
+        with open(self.journal_path, "ab") as fout:
+            fout.write(data)
+        self._size = size + len(data)
+
+    def compact(self):
+        """Moves the journal's records into the history, after the snapshot has been rewritten.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as fin, open(self.history_path, "a") as fout:
+            shutil.copyfileobj(fin, fout)
+        os.remove(self.journal_path)
+        self._size = 0
+
+    def as_of(self, quiz: str) -> dict:
+        """Rebuilds the student dictionaries as they were after the last change for a quiz.
+        """
+        records = self._read_records(self.history_path) + self.read()
+        last = max((i for i, r in enumerate(records) if r["quiz"] == quiz), default=None)
+        if last is None:
+            raise UnknownJournalPointError(f"No student changes were recorded for '{quiz}'.")
+        students = {}
+        if os.path.exists(self.base_path):
+            with open(self.base_path, "r") as fin:
+                students = json.load(fin)
+        return self.replay(students, records[:last + 1])
+
+
+class UnknownJournalPointError(Exception):
+    pass
@@ -0,0 +1,154 @@
+from array import array
+
+
+class Student():
+    """A student in a course, stored compactly.
+
+    Answered questions are kept as a sorted integer array per quiz, while homework and disallowed
+    questions are frozensets, so membership checks stay constant time for large rosters. The order
+    they were loaded in is kept alongside, so they serialize back out as they were. Any properties
+    beyond the standard ones are kept in `extra` and serialized back out unchanged.
+    """
+    __slots__ = (
+        "id",
+        "first_name",
+        "last_name",
+        "email",
+        "section",
+        "username",
+        "answered",
+        "bonus",
+        "penalty",
+        "hw",
+        "disallowed",
+        "max_questions",
+        "extra",
+        "_all_answered",
+        "_set_order",
+    )
+
+    text_properties = ("id", "first_name", "last_name", "email", "section", "username")
+    set_properties = ("hw", "disallowed")
+    defaults = {
+        "bonus": 0,
+        "penalty": 0,
+        "max_questions": 8,
+    }
+
+    def __init__(self, sid: str, first_name="", last_name="", email="", section="", username="",
+                 answered=None, bonus=0, penalty=0, hw=(), disallowed=(), max_questions=8,
+                 extra=None):
+        self.id = sid
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        self.section = section
+        self.username = username
+        self.answered = {}
+        self.bonus = bonus
+        self.penalty = penalty
+        self.max_questions = max_questions
+        self.extra = extra if extra else {}
+        self._all_answered = None
+        self._set_order = {}
+        self.set_property("hw", hw)
+        self.set_property("disallowed", disallowed)
+        for name, q_nums in (answered or {}).items():
+            self.add_answered(name, q_nums)
+
+    def __repr__(self):
+        return "Student({!r}, {!r}, {!r})".format(self.id, self.first_name, self.last_name)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Creates a student from its on-disk dictionary representation.
+        """
+        data = dict(data)
+        kwargs = {p: data.pop(p, "") for p in cls.text_properties}
+        kwargs["sid"] = kwargs.pop("id")
+        kwargs["answered"] = data.pop("answered", {})
+        for p in cls.set_properties:
+            kwargs[p] = data.pop(p, ())
+        for p, default in cls.defaults.items():
+            kwargs[p] = data.pop(p, default)
+        kwargs["extra"] = data
+        return cls(**kwargs)
+
+    def to_dict(self) -> dict:
+        """Returns the on-disk dictionary representation of the student.
+        """
+        data = dict(self.extra)
+        for p in self.text_properties:
+            data[p] = getattr(self, p)
+        data["answered"] = {name: q_nums.tolist() for name, q_nums in self.answered.items()}
+        for p in self.set_properties:
+            data[p] = self._get_ordered(p)
+        for p in self.defaults:
+            data[p] = getattr(self, p)
+        return data
+
+    def _get_ordered(self, name: str) -> list:
+        """Returns a set-like property in the order it was given, with any additions made
+        through set operations at the end.
+        """
+        values = getattr(self, name)
+        ordered = [v for v in self._set_order.get(name, ()) if v in values]
+        kept = set(ordered)
+        return ordered + sorted((v for v in values if v not in kept), key=str)
+
+    @property
+    def all_answered(self) -> frozenset:
+        """All questions the student has answered, across every quiz.
+        """
+        if self._all_answered is None:
+            self._all_answered = frozenset(q for q_nums in self.answered.values() for q in q_nums)
+        return self._all_answered
+
+    @property
+    def answered_count(self) -> int:
+        """The number of answered question entries, across every quiz.
+        """
+        return sum(len(q_nums) for q_nums in self.answered.values())
+
+    def iter_answered(self):
+        """Yields every answered question entry, quiz by quiz.
+        """
+        for q_nums in self.answered.values():
+            yield from q_nums
+
+    def add_answered(self, name: str, q_nums):
+        """Merges the given question numbers into the student's answers for a quiz.
+        """
+        merged = set(q_nums).union(self.answered.get(name, ()))
+        self.answered[name] = array("i", sorted(merged))
+        self._all_answered = None
+
+    def has_property(self, name: str) -> bool:
+        return name in self.__slots__ and not name.startswith("_") or name in self.extra
+
+    def get_property(self, name: str):
+        if name in self.extra:
+            return self.extra[name]
+        return getattr(self, name)
+
+    def set_property(self, name: str, value):
+        """Sets a property, converting set-like properties and answers to their compact forms.
+        """
+        if name == "answered":
+            self.answered = {}
+            for quiz_name, q_nums in value.items():
+                self.add_answered(quiz_name, q_nums)
+        elif name in self.set_properties:
+            if not isinstance(value, (set, frozenset)):
+                self._set_order[name] = tuple(dict.fromkeys(value))
+            setattr(self, name, frozenset(value))
+        elif name in self.__slots__ and name != "extra" and not name.startswith("_"):
+            setattr(self, name, value)
+        else:
+            self.extra[name] = value
+
+    def update(self, values: dict):
+        """Sets every property in the given dictionary.
+        """
+        for name, value in values.items():
+            self.set_property(name, value)
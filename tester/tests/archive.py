@@ -0,0 +1,175 @@
+import datetime
+import hashlib
+import json
+import os
+import zlib
+
+CHUNK_BOUNDARY = b"endobj"  # Chunks end after PDF objects, so unchanged objects deduplicate
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+COMPRESSION_LEVEL = 9
+
+
+def split_chunks(data: bytes) -> list:
+    """Splits file content into chunks at boundaries that depend on the content itself.
+
+    Chunks end after a PDF object once they reach a minimum size, so an edit to one object of a
+    PDF only changes the chunks around it. Content without boundaries is split at a maximum size.
+    """
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = data.find(CHUNK_BOUNDARY, start + MIN_CHUNK_SIZE)
+        if end == -1:
+            end = len(data)
+        else:
+            end += len(CHUNK_BOUNDARY)
+        end = min(end, start + MAX_CHUNK_SIZE)
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def get_student_files(test_path: str, manifest: dict = None) -> dict:
+    """Returns the file of each student in a test directory, named like "<last name>_<id>.pdf".
+
+    Without a manifest, every file following that naming is assumed to be a student's test.
+    """
+    student_files = {}
+    for file_name in os.listdir(test_path):
+        base_name = os.path.splitext(file_name)[0]
+        _, separator, sid = base_name.rpartition("_")
+        if not separator or file_name.startswith("_"):
+            continue
+        if manifest is None or sid in manifest:
+            student_files[sid] = file_name
+    return student_files
+
+
+class TestArchive():
+    """A content-addressed store of archived test directories.
+
+    Files are split into chunks that are compressed and stored once under their hash, so
+    identical tests and the unchanged parts of similar solutions are only stored once. The index
+    records the chunks of each file of each archived test, and which file belongs to which student.
+    """
+    def __init__(self, path: str, index_file_name: str):
+        self.path = path
+        self.objects_path = os.path.join(path, "objects")
+        self.index_path = os.path.join(path, index_file_name)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as fin:
+                self.index = json.load(fin)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def _store_chunk(self, chunk: bytes) -> tuple:
+        """Stores a chunk unless it is already stored, returning its hash and stored size.
+        """
+        digest = hashlib.sha256(chunk).hexdigest()
+        object_path = self._object_path(digest)
+        if os.path.exists(object_path):
+            return digest, 0
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        compressed = zlib.compress(chunk, COMPRESSION_LEVEL)
+        partial_path = f"{object_path}.{os.getpid()}.part"
+        with open(partial_path, "wb") as fout:
+            fout.write(compressed)
+        os.replace(partial_path, object_path)
+        return digest, len(compressed)
+
+    def _save_index(self):
+        partial_path = f"{self.index_path}.{os.getpid()}.part"
+        with open(partial_path, "w") as fout:
+            json.dump(self.index, fout, sort_keys=True)
+        os.replace(partial_path, self.index_path)
+
+    def add(self, test_name: str, test_path: str, manifest: dict = None) -> tuple:
+        """Stores every file of a test directory and records the test in the index.
+
+        Returns the total size of the test's files and the number of bytes newly stored.
+        """
+        files = {}
+        total_size = 0
+        stored_size = 0
+        for dir_path, _, file_names in os.walk(test_path):
+            for file_name in sorted(file_names):
+                file_path = os.path.join(dir_path, file_name)
+                with open(file_path, "rb") as fin:
+                    data = fin.read()
+                chunk_digests = []
+                for chunk in split_chunks(data):
+                    digest, size = self._store_chunk(chunk)
+                    chunk_digests.append(digest)
+                    stored_size += size
+                files[os.path.relpath(file_path, test_path)] = {
+                    "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                    "chunks": chunk_digests
+                }
+                total_size += len(data)
+        self.index[test_name] = {
+            "archived": datetime.datetime.now().isoformat(timespec="seconds"),
+            "files": files,
+            "students": get_student_files(test_path, manifest)
+        }
+        self._save_index()
+        return total_size, stored_size
+
+    def read_file(self, test_name: str, file_name: str) -> bytes:
+        """Reassembles an archived file, checking it against the hash recorded when archived.
+        """
+        entry = self.index[test_name]["files"][file_name]
+        chunks = []
+        for digest in entry["chunks"]:
+            with open(self._object_path(digest), "rb") as fin:
+                chunks.append(zlib.decompress(fin.read()))
+        data = b"".join(chunks)
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise CorruptArchiveError(f"Archived file '{file_name}' of '{test_name}' is corrupt.")
+        return data
+
+    def extract(self, test_name: str, output_path: str, file_names: list = None) -> list:
+        """Writes archived files of a test into a directory, returning their paths.
+        """
+        if test_name not in self.index:
+            raise UnknownArchivedTestError(f"Test '{test_name}' is not archived.")
+        if file_names is None:
+            file_names = sorted(self.index[test_name]["files"])
+        paths = []
+        for file_name in file_names:
+            file_path = os.path.join(output_path, file_name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as fout:
+                fout.write(self.read_file(test_name, file_name))
+            paths.append(file_path)
+        return paths
+
+    def get_student_file(self, test_name: str, sid: str) -> str:
+        """Returns the name of a student's archived test file.
+        """
+        if test_name not in self.index:
+            raise UnknownArchivedTestError(f"Test '{test_name}' is not archived.")
+        students = self.index[test_name]["students"]
+        if sid not in students:
+            raise UnknownArchivedTestError(f"Student '{sid}' has no archived test '{test_name}'.")
+        return students[sid]
+
+    def get_stored_size(self) -> int:
+        """Returns the number of bytes the store takes on disk.
+        """
+        return sum(
+            os.path.getsize(os.path.join(dir_path, file_name))
+            for dir_path, _, file_names in os.walk(self.objects_path)
+            for file_name in file_names
+        )
+
+
+class CorruptArchiveError(Exception):
+    pass
+
+
+class UnknownArchivedTestError(Exception):
+    pass
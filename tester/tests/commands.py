@@ -0,0 +1,208 @@
+import json
+import os
+import shutil
+import sys
+import time
+
+import click
+
+from tester.build.pipeline import get_test_directory_path
+from tester.config import Config
+from tester.tests.archive import TestArchive, get_student_files
+from tester.tests.export import get_build_progress, get_export_entries, write_tar, write_zip
+
+EXPORT_PATTERN = "{last_name}_{id}{ext}"
+
+
+@click.group()
+@click.pass_context
+def tests(ctx):
+    """Manage built tests of the active course.
+    """
+    pass
+
+
+def _open_archive(config: Config) -> TestArchive:
+    return TestArchive(config.archive_dir_path, config.archive_index_file_name)
+
+
+def _format_size(size: int) -> str:
+    """Formats a number of bytes for display, e.g. "1.5 MB".
+    """
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+@tests.command("archive")
+@click.argument("names", nargs=-1)
+@click.option("--older-than", default=None, type=int,
+              help="Archive every test directory not modified in this many days.")
+@click.option("--keep", is_flag=True, default=False,
+              help="Keep the test directories after archiving them.")
+@click.pass_obj
+def archive(config: Config, names: tuple, older_than: int, keep: bool):
+    """Moves test directories into the course's deduplicated, compressed archive.
+    """
+    tests_path = os.path.join(config.active_course_path, config.tests_dir_name)
+    names = list(names)
+    if older_than is not None:
+        cutoff = time.time() - older_than * 24 * 60 * 60
+        names += [
+            name for name in sorted(os.listdir(tests_path))
+            if os.path.isdir(os.path.join(tests_path, name)) and name not in names
+            and os.path.getmtime(os.path.join(tests_path, name)) < cutoff
+        ]
+    if not names:
+        print(": No test directories to archive.")
+        return
+
+    test_archive = _open_archive(config)
+    for name in names:
+        test_path = get_test_directory_path(config, name)
+        if not os.path.isdir(test_path):
+            print(f"! No test directory found for '{name}'.")
+            continue
+        if name in test_archive.index:
+            print(f"! Test '{name}' is already archived; extract or rename it first.")
+            continue
+        manifest = None
+        manifest_path = os.path.join(test_path, config.manifest_file_name)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as fin:
+                manifest = json.load(fin)
+        total_size, stored_size = test_archive.add(name, test_path, manifest)
+        if not keep:
+            shutil.rmtree(test_path)
+        print(f": Archived '{name}': {_format_size(total_size)} stored as "
+              f"{_format_size(stored_size)} of new data.")
+
+
+@tests.command("extract")
+@click.argument("name")
+@click.option("--sid", default=None, help="Only extract the test of the student with this ID.")
+@click.option("--output", "output_path", default=None,
+              help="The directory to extract into (defaults to the test's directory).")
+@click.pass_obj
+def extract(config: Config, name: str, sid: str, output_path: str):
+    """Extracts an archived test, or a single student's test, from the archive.
+    """
+    test_archive = _open_archive(config)
+    if output_path is None:
+        output_path = get_test_directory_path(config, name)
+    file_names = [test_archive.get_student_file(name, sid)] if sid else None
+    paths = test_archive.extract(name, output_path, file_names)
+    if sid:
+        print(f": Extracted '{paths[0]}'")
+    else:
+        print(f": Extracted {len(paths)} files of '{name}' into '{output_path}'")
+
+
+@tests.command("list")
+@click.pass_obj
+def list_archived(config: Config):
+    """Lists the archived tests and how much space the archive saves.
+    """
+    test_archive = _open_archive(config)
+    if not test_archive.index:
+        print(": No archived tests.")
+        return
+    total_size = 0
+    for name, entry in sorted(test_archive.index.items()):
+        size = sum(f["size"] for f in entry["files"].values())
+        total_size += size
+        print(f"{name}  {entry['archived']}  {len(entry['students'])} students  "
+              f"{_format_size(size)}")
+    stored_size = test_archive.get_stored_size()
+    print(f": {len(test_archive.index)} tests, {_format_size(total_size)} stored in "
+          f"{_format_size(stored_size)}.")
+
+
+def _write_bundle(entries: list, output_path: str, output_format: str):
+    """Writes one export bundle to a file, or to stdout if the path is "-".
+    """
+    write_bundle = write_zip if output_format == "zip" else write_tar
+    if output_path == "-":
+        write_bundle(entries, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+        return
+    partial_path = f"{output_path}.{os.getpid()}.part"
+    with open(partial_path, "wb") as fout:
+        write_bundle(entries, fout)
+    os.replace(partial_path, output_path)
+
+
+@tests.command("export")
+@click.argument("name")
+@click.option("--output", "output_path", default=None,
+              help="The file to write, '-' for stdout, or with --split-section a directory "
+                   "(defaults to NAME.zip or NAME.tar in the current directory).")
+@click.option("--format", "output_format", default="zip", type=click.Choice(["zip", "tar"]),
+              help="The bundle format.")
+@click.option("--pattern", default=EXPORT_PATTERN,
+              help="The name of each test in the bundle, using the fields {id}, {username}, "
+                   "{section}, {first_name}, {last_name}, {email}, {test} and {ext}.")
+@click.option("--split-section", is_flag=True, default=False,
+              help="Write one bundle per section, each as soon as all its tests are built.")
+@click.option("--wait", is_flag=True, default=False,
+              help="With --split-section, wait for a build in progress to finish every section.")
+@click.option("--interval", default=5.0, type=float,
+              help="With --wait, the number of seconds between checks for finished tests.")
+@click.option("--timeout", default=None, type=float,
+              help="With --wait, the number of seconds after which sections are exported with "
+                   "whatever tests are built.")
+@click.pass_obj
+def export(config: Config, name: str, output_path: str, output_format: str, pattern: str,
+           split_section: bool, wait: bool, interval: float, timeout: float):
+    """Streams the tests of a build into a zip or tar bundle for bulk upload.
+    """
+    test_path = get_test_directory_path(config, name)
+    manifest = config.get_manifest(name)
+    if not split_section:
+        if output_path is None:
+            output_path = f"{name}.{output_format}"
+        entries = get_export_entries(config, name, test_path, manifest, pattern)
+        _write_bundle(entries, output_path, output_format)
+        if output_path != "-":
+            print(f": Exported {len(entries)} tests of '{name}' to '{output_path}'")
+        return
+
+    output_path = output_path or "."
+    os.makedirs(output_path, exist_ok=True)
+    section_sids = {}
+    students = {s["id"]: s for s in config.get_students_index()}
+    for sid in manifest:
+        section_sids.setdefault(students.get(sid, {}).get("section", ""), set()).add(sid)
+    pending = set(section_sids)
+    deadline = time.monotonic() + timeout if timeout else None
+    while pending:
+        entries = get_export_entries(config, name, test_path, manifest, pattern)
+        if wait:
+            completed, failed = get_build_progress(config, test_path)
+        else:
+            completed = {
+                sid: os.path.abspath(os.path.join(test_path, file_name))
+                for sid, file_name in get_student_files(test_path, manifest).items()
+            }
+            failed = {}
+        timed_out = deadline is not None and time.monotonic() >= deadline
+        completed_paths = set(completed.values())
+        for section in sorted(pending):
+            # A section is ready once each of its tests was rendered or failed for good
+            if wait and not timed_out and section_sids[section] - set(completed) - set(failed):
+                continue
+            section_entries = [
+                e for e in entries if e[0] == section and os.path.abspath(e[1]) in completed_paths
+            ]
+            bundle_path = os.path.join(output_path, f"{name}_{section or 'none'}.{output_format}")
+            _write_bundle(section_entries, bundle_path, output_format)
+            print(f": Exported {len(section_entries)} tests of section '{section}' to "
+                  f"'{bundle_path}'")
+            missing = sorted(section_sids[section] - set(completed))
+            if missing:
+                print(f"! Missing tests of section '{section}': {', '.join(missing)}")
+            pending.remove(section)
+        if pending:
+            time.sleep(interval)
@@ -0,0 +1,90 @@
+import glob
+import os
+import shutil
+import string
+import tarfile
+import zipfile
+
+from tester.build.render import Checkpoint
+from tester.config import STUDENT_INDEX_FIELDS, Config
+from tester.tests.archive import get_student_files
+
+COPY_BUFFER_SIZE = 1024 * 1024
+STORED_EXTS = {".pdf"}  # Already compressed, so they're stored as is
+
+
+def get_pattern_fields(pattern: str) -> list:
+    """Returns the fields used in an export file name pattern, checking they are all known.
+    """
+    known_fields = STUDENT_INDEX_FIELDS + ["test", "ext"]
+    fields = [f for _, f, _, _ in string.Formatter().parse(pattern) if f is not None]
+    if not fields or set(fields) - set(known_fields):
+        raise InvalidExportPatternError(
+            f"Export file names may only use the fields: {', '.join(known_fields)}."
+        )
+    return fields
+
+
+def get_export_entries(config: Config, test_name: str, test_path: str, manifest: dict,
+                       pattern: str) -> list:
+    """Returns the section, source path and archive name of every student's test.
+    """
+    get_pattern_fields(pattern)
+    students = {s["id"]: s for s in config.get_students_index()}
+    entries = []
+    for sid, file_name in sorted(get_student_files(test_path, manifest).items()):
+        fields = dict.fromkeys(STUDENT_INDEX_FIELDS, "")
+        fields.update(students.get(sid, {"id": sid}))
+        fields["test"] = test_name
+        fields["ext"] = os.path.splitext(file_name)[1]
+        entries.append((fields["section"], os.path.join(test_path, file_name),
+                        pattern.format(**fields)))
+    arc_names = [arc_name for _, _, arc_name in entries]
+    if len(set(arc_names)) != len(arc_names):
+        raise InvalidExportPatternError(f"Pattern '{pattern}' gives several tests the same name.")
+    return entries
+
+
+def get_build_progress(config: Config, test_path: str) -> tuple:
+    """Returns the tests recorded as fully rendered by any part of a build, and those that failed.
+
+    Rendered tests are given as absolute paths and failed ones as error messages, both keyed by
+    student ID.
+    """
+    name, ext = os.path.splitext(config.checkpoint_file_name)
+    completed = {}
+    failed = {}
+    for checkpoint_path in glob.glob(os.path.join(test_path, f"{name}*{ext}")):
+        checkpoint = Checkpoint(checkpoint_path)
+        completed.update((k, os.path.abspath(p)) for k, p in checkpoint.load().items())
+        failed.update(checkpoint.load_failures())
+    return completed, {k: e for k, e in failed.items() if k not in completed}
+
+
+def write_zip(entries: list, fout):
+    """Streams the given files into a zip archive, copying each in chunks.
+
+    Works with unseekable outputs such as stdout.
+    """
+    with zipfile.ZipFile(fout, "w") as zout:
+        for _, source_path, arc_name in entries:
+            zinfo = zipfile.ZipInfo.from_file(source_path, arc_name)
+            if os.path.splitext(source_path)[1] in STORED_EXTS:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            with open(source_path, "rb") as fin, zout.open(zinfo, "w") as dest:
+                shutil.copyfileobj(fin, dest, COPY_BUFFER_SIZE)
+
+
+def write_tar(entries: list, fout):
+    """Streams the given files into a tar archive, copying each in chunks.
+    """
+    with tarfile.open(fileobj=fout, mode="w|", bufsize=COPY_BUFFER_SIZE) as tout:
+        for _, source_path, arc_name in entries:
+            with open(source_path, "rb") as fin:
+                tout.addfile(tout.gettarinfo(source_path, arc_name), fin)
+
+
+class InvalidExportPatternError(Exception):
+    pass
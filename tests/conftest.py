@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+from tester.config import Config
+
+STUDENTS = {
+    "1": {"id": "1", "first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.edu",
+          "section": "A", "username": "ada", "answered": {"q1": [1]}, "hw": [1],
+          "disallowed": [], "bonus": 0, "penalty": 0, "max_questions": 3},
+    "2": {"id": "2", "first_name": "Alan", "last_name": "Turing", "email": "alan@example.edu",
+          "section": "B", "username": "alan", "answered": {}, "hw": [], "disallowed": [],
+          "bonus": 0, "penalty": 0, "max_questions": 3},
+}
+
+
+@pytest.fixture
+def config(tmp_path) -> Config:
+    """A course with two students and a small question pool in a temporary data directory.
+    """
+    course_path = tmp_path / "course"
+    for q_num in range(1, 4):
+        q_path = course_path / "_questions" / str(q_num)
+        q_path.mkdir(parents=True)
+        (q_path / "1.md").write_text(f"Question {q_num}\n")
+        (q_path / "1.solution.md").write_text(f"Answer {q_num}\n")
+    (course_path / "_tests").mkdir()
+    (course_path / "students.json").write_text(json.dumps(STUDENTS))
+    (course_path / "modules.json").write_text(json.dumps({
+        "1": {"name": "M1", "hw": [1], "questions": [1, 2, 3]}
+    }))
+    return Config(str(tmp_path), "course")
+
+
+def write_manifest(config: Config, test_name: str, manifest: dict) -> str:
+    """Creates a built test directory holding only its manifest, returning its path.
+    """
+    test_path = os.path.join(config.active_course_path, config.tests_dir_name, test_name)
+    os.makedirs(test_path, exist_ok=True)
+    config.save_manifest(test_name, manifest)
+    return test_path
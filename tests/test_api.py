@@ -0,0 +1,58 @@
+import pytest
+
+from tester import api
+
+from conftest import write_manifest
+
+MANIFEST = {"1": {"questions": [2, 3]}, "2": {"questions": [1, 2]}}
+
+
+@pytest.fixture
+def results_path(config, tmp_path):
+    write_manifest(config, "quiz2", MANIFEST)
+    return tmp_path / "results.csv"
+
+
+def test_results_add_passed_questions(config, results_path):
+    results_path.write_text("ID,Q1,Q2\n1,Y,n\n\n2, 0 , F\n")
+    assert api.apply_results(config, "quiz2", str(results_path)) == ["1"]
+
+    students = config.get_students()
+    assert students["1"].to_dict()["answered"] == {"q1": [1], "quiz2": [2]}
+    assert not students["2"].answered
+    assert config.students_journal.read()[-1]["quiz"] == "quiz2"
+
+
+def test_marks_may_be_written_together(config, results_path):
+    results_path.write_text("1,+-\n2,P1\n")
+    assert api.apply_results(config, "quiz2", str(results_path)) == ["1", "2"]
+    assert sorted(config.get_students()["2"].all_answered) == [1, 2]
+
+
+@pytest.mark.parametrize("results, error", [
+    ("1,Y\n", api.InvalidResultsError),
+    ("1,Y,Y,Y\n", api.InvalidResultsError),
+    ("1,Y,?\n", api.InvalidResultsError),
+    ("3,Y,Y\n", api.UnknownStudentResultError),
+])
+def test_invalid_results_are_rejected(config, results_path, results, error):
+    results_path.write_text(results)
+    with pytest.raises(error):
+        api.apply_results(config, "quiz2", str(results_path))
+    assert config.students_journal.read() == []
+
+
+def test_grades_as_of_a_quiz(config, results_path):
+    results_path.write_text("1,Y,N\n")
+    api.apply_results(config, "quiz2", str(results_path))
+    write_manifest(config, "quiz3", {"1": {"questions": [3]}})
+    results_path.write_text("1,Y\n")
+    api.apply_results(config, "quiz3", str(results_path))
+
+    grades = {g.student.id: g for g in api.grade_roster(config)}
+    assert (grades["1"].points, grades["1"].grade) == (3, 100.0)
+    # Student 2 never turned in the module's homework
+    assert grades["2"].missing_hw == [("1", 1, [])]
+
+    before = {g.student.id: g for g in api.grade_roster(config, as_of="quiz2")}
+    assert before["1"].points == 2
@@ -0,0 +1,84 @@
+import importlib
+import os
+
+import pytest
+
+# Imported through its module so pytest doesn't collect TestArchive as a test class
+archive_module = importlib.import_module("tester.tests.archive")
+MIN_CHUNK_SIZE = archive_module.MIN_CHUNK_SIZE
+CorruptArchiveError = archive_module.CorruptArchiveError
+UnknownArchivedTestError = archive_module.UnknownArchivedTestError
+split_chunks = archive_module.split_chunks
+
+
+def make_pdf(objects: list) -> bytes:
+    return b"%PDF-1.4\n" + b"".join(
+        f"{i} 0 obj\n{body}\nendobj\n".encode() for i, body in enumerate(objects, start=1)
+    )
+
+
+def write_test(path, files: dict) -> str:
+    path.mkdir(parents=True)
+    for file_name, data in files.items():
+        (path / file_name).write_bytes(data)
+    return str(path)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return archive_module.TestArchive(str(tmp_path / "_archive"), "index.json")
+
+
+def test_chunks_end_after_objects():
+    data = make_pdf(["x" * MIN_CHUNK_SIZE] * 3)
+    chunks = split_chunks(data)
+    assert b"".join(chunks) == data
+    assert [chunk.endswith(b"endobj") for chunk in chunks] == [True, True, True, False]
+
+
+def test_round_trip(archive, tmp_path):
+    files = {
+        "Lovelace_1.pdf": make_pdf(["a" * MIN_CHUNK_SIZE, "b"]),
+        "_manifest.json": b"{\"1\": {}}",
+    }
+    test_path = write_test(tmp_path / "quiz1", files)
+    total_size, stored_size = archive.add("quiz1", test_path, {"1": {}})
+    assert total_size == sum(len(data) for data in files.values())
+    assert 0 < stored_size
+
+    reopened = archive_module.TestArchive(archive.path, "index.json")
+    paths = reopened.extract("quiz1", str(tmp_path / "restored"))
+    assert sorted(os.path.basename(p) for p in paths) == sorted(files)
+    for path in paths:
+        with open(path, "rb") as fin:
+            assert fin.read() == files[os.path.basename(path)]
+    assert reopened.get_student_file("quiz1", "1") == "Lovelace_1.pdf"
+
+
+def test_shared_chunks_are_stored_once(archive, tmp_path):
+    shared = "s" * MIN_CHUNK_SIZE
+    first = write_test(tmp_path / "quiz1", {"A_1.pdf": make_pdf([shared, "one"])})
+    second = write_test(tmp_path / "quiz2", {"A_1.pdf": make_pdf([shared, "two"])})
+    _, first_stored = archive.add("quiz1", first)
+    stored_after_first = archive.get_stored_size()
+    _, second_stored = archive.add("quiz2", second)
+    assert second_stored < first_stored
+    assert archive.get_stored_size() - stored_after_first == second_stored
+    assert archive.read_file("quiz2", "A_1.pdf") == make_pdf([shared, "two"])
+
+
+def test_corrupt_chunks_are_detected(archive, tmp_path):
+    archive.add("quiz1", write_test(tmp_path / "quiz1", {"A_1.pdf": make_pdf(["x"])}))
+    digest = archive.index["quiz1"]["files"]["A_1.pdf"]["chunks"][0]
+    archive.index["quiz1"]["files"]["A_1.pdf"]["sha256"] = "0" * 64
+    assert os.path.exists(archive._object_path(digest))
+    with pytest.raises(CorruptArchiveError):
+        archive.read_file("quiz1", "A_1.pdf")
+
+
+def test_unknown_tests_and_students(archive, tmp_path):
+    archive.add("quiz1", write_test(tmp_path / "quiz1", {"A_1.pdf": make_pdf(["x"])}))
+    with pytest.raises(UnknownArchivedTestError):
+        archive.extract("quiz9", str(tmp_path / "out"))
+    with pytest.raises(UnknownArchivedTestError):
+        archive.get_student_file("quiz1", "2")
@@ -0,0 +1,52 @@
+import importlib
+import os
+
+import pytest
+
+from tester.build.assets import AssetCache
+
+# `tester.build` is also the name of a CLI command, so the module is looked up by name
+assets_module = importlib.import_module("tester.build.assets")
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch) -> AssetCache:
+    monkeypatch.setattr(assets_module, "render_math", lambda source: b"<svg/>")
+    return AssetCache(str(tmp_path / "assets"))
+
+
+def test_math_is_replaced_with_cached_images(assets):
+    content = assets.preprocess("Solve $$x^2 = 4$$ for x.")
+    assert content.startswith("Solve <img class=\"math\" src=\"file://")
+    assert content.endswith("\"> for x.")
+    assert len(os.listdir(assets.cache_path)) == 1
+
+
+def test_math_in_code_is_left_alone(assets):
+    content = (
+        "Run `echo $$ $$` first.\n\n"
+        "```bash\necho $$\necho $$\n```\n\n"
+        "~~~\n$$ not math $$\n~~~\n\n"
+        "But $$y$$ is math.\n"
+    )
+    preprocessed = assets.preprocess(content)
+    assert preprocessed.count("<img") == 1
+    assert "`echo $$ $$`" in preprocessed
+    assert "```bash\necho $$\necho $$\n```" in preprocessed
+    assert "~~~\n$$ not math $$\n~~~" in preprocessed
+
+
+def test_same_math_is_rendered_once(assets):
+    assets.preprocess("$$a$$ and $$a$$")
+    assert len(os.listdir(assets.cache_path)) == 1
+
+
+def test_local_file_access_only_for_cached_assets(config, assets):
+    pipeline = importlib.import_module("tester.build.pipeline")
+    plain = pipeline.get_pdf_options(config, "<p>No assets</p>")
+    assert "enable-local-file-access" not in plain
+
+    html_text = "<p>{}</p>".format(assets.preprocess("$$x$$"))
+    options = pipeline.get_pdf_options(config, html_text)
+    assert options["enable-local-file-access"] == ""
+    assert "enable-local-file-access" not in config.pdf_options
@@ -0,0 +1,68 @@
+import importlib
+import os
+
+from tester.questions.bundle import open_question_bundle, pack_questions
+
+# Looked up through its module so pytest doesn't collect TestTemplate as a test class
+template_module = importlib.import_module("tester.build.template")
+
+
+def pack(config):
+    bundle_path = os.path.join(config.cache_dir_path, config.question_bundle_file_name)
+    return pack_questions(config, bundle_path)
+
+
+def option_path(config, q_num: int) -> str:
+    return os.path.join(config.questions_dir_path, str(q_num), "1.md")
+
+
+def test_bundle_reads_packed_options(config):
+    assert pack(config) == 3
+    bundle = open_question_bundle(config)
+    assert bundle.read_option_lines(option_path(config, 2)) == ["Question 2\n"]
+    assert bundle.read_solution_lines(option_path(config, 2)) == ["Answer 2\n"]
+
+
+def test_changed_options_are_read_from_disk(config):
+    pack(config)
+    with open(option_path(config, 1), "w") as fout:
+        fout.write("Edited question\nover two lines\n")
+    with open(config.get_solution_path(option_path(config, 3)), "w") as fout:
+        fout.write("Edited answer\n")
+
+    bundle = open_question_bundle(config)
+    assert set(bundle.index) == {os.path.join("2", "1.md")}
+    assert bundle.read_option_lines(option_path(config, 1)) == [
+        "Edited question\n", "over two lines\n"
+    ]
+    assert bundle.read_solution_lines(option_path(config, 3)) == ["Edited answer\n"]
+
+
+def test_missing_bundle_is_not_opened(config):
+    assert open_question_bundle(config) is None
+
+
+def test_packed_lines_match_lines_read_from_disk(config):
+    with open(option_path(config, 1), "w", newline="") as fout:
+        fout.write("Question 4\r\nline two\x0cform feed\r\nlast\rline")
+    pack(config)
+
+    bundle = open_question_bundle(config)
+    assert os.path.join("1", "1.md") in bundle.index
+    with open(option_path(config, 1)) as fin:
+        assert bundle.read_option_lines(option_path(config, 1)) == fin.readlines()
+
+
+def test_templates_use_packed_line_counts(config):
+    with open(option_path(config, 1), "w") as fout:
+        fout.write("| a | b |\n|---|---|\n| 1 | 2 |\n")
+    pack(config)
+    bundle = open_question_bundle(config)
+    assert bundle.get_line_count(option_path(config, 1)) == 5
+
+    template = template_module.TestTemplate("Header", read_lines=bundle.read_option_lines,
+                                            get_line_count=bundle.get_line_count)
+    assert template.get_fragment(1, option_path(config, 1)).line_count == 5
+    with open(option_path(config, 2), "a") as fout:
+        fout.write("Edited\n")
+    assert open_question_bundle(config).get_line_count(option_path(config, 2)) is None
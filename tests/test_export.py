@@ -0,0 +1,79 @@
+import os
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from tester.build.render import Checkpoint
+from tester.tests.commands import export
+from tester.tests.export import (InvalidExportPatternError, get_build_progress,
+                                 get_export_entries)
+
+from conftest import write_manifest
+
+MANIFEST = {"1": {"questions": [1, 2]}, "2": {"questions": [2, 3]}}
+
+
+@pytest.fixture
+def test_path(config) -> str:
+    test_path = write_manifest(config, "quiz1", MANIFEST)
+    for file_name in ("Lovelace_1.pdf", "Turing_2.pdf"):
+        with open(os.path.join(test_path, file_name), "wb") as fout:
+            fout.write(b"%PDF-1.4\n")
+    return test_path
+
+
+def test_entries_are_named_by_pattern(config, test_path):
+    entries = get_export_entries(config, "quiz1", test_path, MANIFEST, "{section}/{username}{ext}")
+    assert [(section, arc_name) for section, _, arc_name in entries] == [
+        ("A", "A/ada.pdf"), ("B", "B/alan.pdf")
+    ]
+
+
+@pytest.mark.parametrize("pattern", ["{id}{ext}{nope}", "no fields", "{test}{ext}"])
+def test_invalid_patterns_are_rejected(config, test_path, pattern):
+    with pytest.raises(InvalidExportPatternError):
+        get_export_entries(config, "quiz1", test_path, MANIFEST, pattern)
+
+
+def test_later_checkpoint_records_win(config, test_path):
+    checkpoint = Checkpoint(os.path.join(test_path, config.checkpoint_file_name))
+    checkpoint.record_failure("1", "Timed out after 1s")
+    checkpoint.record("1", os.path.join(test_path, "Lovelace_1.pdf"))
+    checkpoint.record_failure("2", "Timed out after 1s")
+
+    completed, failed = get_build_progress(config, test_path)
+    assert completed == {"1": os.path.abspath(os.path.join(test_path, "Lovelace_1.pdf"))}
+    assert failed == {"2": "Timed out after 1s"}
+
+
+def test_waiting_export_stops_once_failures_are_recorded(config, test_path, tmp_path):
+    checkpoint = Checkpoint(os.path.join(test_path, config.checkpoint_file_name))
+    checkpoint.record("1", os.path.join(test_path, "Lovelace_1.pdf"))
+    checkpoint.record_failure("2", "Process exited with code 1")
+    os.remove(os.path.join(test_path, "Turing_2.pdf"))
+
+    output_path = str(tmp_path / "out")
+    result = CliRunner().invoke(
+        export, ["quiz1", "--split-section", "--wait", "--interval", "0", "--output", output_path],
+        obj=config
+    )
+    assert result.exit_code == 0, result.output
+    assert "Missing tests of section 'B': 2" in result.output
+    with zipfile.ZipFile(os.path.join(output_path, "quiz1_A.zip")) as zin:
+        assert zin.namelist() == ["Lovelace_1.pdf"]
+    with zipfile.ZipFile(os.path.join(output_path, "quiz1_B.zip")) as zin:
+        assert zin.namelist() == []
+
+
+def test_waiting_export_gives_up_after_timeout(config, test_path, tmp_path):
+    checkpoint = Checkpoint(os.path.join(test_path, config.checkpoint_file_name))
+    checkpoint.record("1", os.path.join(test_path, "Lovelace_1.pdf"))
+
+    result = CliRunner().invoke(
+        export, ["quiz1", "--split-section", "--wait", "--interval", "0.01", "--timeout", "0.05",
+                 "--output", str(tmp_path / "out")],
+        obj=config
+    )
+    assert result.exit_code == 0, result.output
+    assert "Missing tests of section 'B': 2" in result.output
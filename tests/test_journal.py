@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from tester.student.journal import UnknownJournalPointError
+from tester.student.model import Student
+
+
+def test_save_appends_only_changed_fields(config):
+    students = config.get_students()
+    students["1"].add_answered("q2", [2])
+    config.save_students(students, op="update", quiz="q2")
+
+    records = config.students_journal.read()
+    assert len(records) == 1
+    assert records[0]["sid"] == "1"
+    assert records[0]["quiz"] == "q2"
+    assert set(records[0]["fields"]) == {"answered"}
+    # The snapshot itself is left alone until the journal is compacted
+    with open(config.students_file_path) as fin:
+        assert json.load(fin)["1"]["answered"] == {"q1": [1]}
+
+
+def test_saving_without_changes_writes_nothing(config):
+    config.save_students(config.get_students())
+    assert config.students_journal.read() == []
+
+
+def test_replay_restores_current_roster(config):
+    students = config.get_students()
+    students["2"].add_answered("q2", [1, 3])
+    del students["1"]
+    config.save_students(students, op="update", quiz="q2")
+
+    reloaded = config.get_students()
+    assert set(reloaded) == {"2"}
+    assert sorted(reloaded["2"].all_answered) == [1, 3]
+
+
+def test_as_of_reads_roster_after_a_quiz(config):
+    for quiz, q_num in [("q2", 2), ("q3", 3)]:
+        students = config.get_students()
+        students["1"].add_answered(quiz, [q_num])
+        config.save_students(students, op="update", quiz=quiz)
+    config.compact_students()
+
+    assert sorted(config.get_students(as_of="q2")["1"].all_answered) == [1, 2]
+    assert sorted(config.get_students(as_of="q3")["1"].all_answered) == [1, 2, 3]
+    with pytest.raises(UnknownJournalPointError):
+        config.get_students(as_of="q9")
+
+
+def test_journal_compacts_once_it_outgrows_the_snapshot(config):
+    config.journal_compact_ratio = 0.5
+    snapshot_size = os.path.getsize(config.students_file_path)
+    students = config.get_students()
+    saves = 0
+    while not saves or config.students_journal.read():
+        assert config.students_journal.size() < snapshot_size * 0.5
+        students["2"].bonus += 1
+        config.save_students(students)
+        saves += 1
+
+    assert saves > 1
+    with open(config.students_file_path) as fin:
+        assert json.load(fin)["2"]["bonus"] == saves
+
+
+def test_bulk_update_of_large_roster_is_journaled(config):
+    students = config.get_students()
+    for i in range(3, 1003):
+        students[str(i)] = Student(str(i), "F", f"L{i}", section="A", hw=[1])
+    config.save_students(students, op="import")
+    config.compact_students()
+
+    for student in students.values():
+        student.add_answered("q2", [2])
+    config.save_students(students, op="record", quiz="q2")
+    assert len(config.students_journal.read()) == 1002
+    assert config.students_journal.size() == os.path.getsize(config.students_journal.journal_path)
+
+
+def test_size_matches_journal_on_disk(config):
+    students = config.get_students()
+    students["1"].bonus = 1
+    students["2"].bonus = 1
+    config.save_students(students)
+
+    # A fresh journal measures the records already on disk
+    size = config.students_journal.size()
+    config.students_journal._size = None
+    assert config.students_journal.size() == size > 0
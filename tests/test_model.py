@@ -0,0 +1,28 @@
+from tester.student.model import Student
+
+DATA = {
+    "id": "1", "first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.edu",
+    "section": "A", "username": "ada", "answered": {"q1": [3, 1]}, "hw": ["hw2", "hw1"],
+    "disallowed": [9, 4], "bonus": 0, "penalty": 0, "max_questions": 8, "nickname": "A",
+}
+
+
+def test_round_trip_keeps_on_disk_format():
+    data = Student.from_dict(DATA).to_dict()
+    assert data == dict(DATA, answered={"q1": [1, 3]})
+    assert list(data["hw"]) == ["hw2", "hw1"]
+
+
+def test_mixed_homework_types_can_be_saved():
+    student = Student.from_dict(DATA)
+    student.set_property("hw", student.get_property("hw") | {3})
+    assert 3 in student.hw and "hw1" in student.hw
+    assert student.to_dict()["hw"] == ["hw2", "hw1", 3]
+
+
+def test_answered_questions_are_merged():
+    student = Student.from_dict(DATA)
+    student.add_answered("q1", [2, 3])
+    student.add_answered("q2", [5])
+    assert student.all_answered == {1, 2, 3, 5}
+    assert student.answered_count == 4
@@ -0,0 +1,63 @@
+import os
+import time
+
+from tester.build.render import JobRunner
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+def fail(x: int):
+    raise ValueError(f"bad job {x}")
+
+
+def crash(x: int):
+    os._exit(3)
+
+
+def test_results_are_keyed_by_job():
+    completed = []
+    results, failures = JobRunner(processes=2).run(
+        square, {str(i): (i,) for i in range(5)}, on_success=lambda k, r: completed.append(k)
+    )
+    assert results == {str(i): i * i for i in range(5)}
+    assert failures == {}
+    assert sorted(completed) == [str(i) for i in range(5)]
+
+
+def test_failures_are_reported_after_retries():
+    results, failures = JobRunner(processes=2, retries=1).run(fail, {"a": (1,)})
+    assert results == {}
+    assert failures == {"a": "ValueError: bad job 1"}
+
+
+def test_crashed_jobs_are_failures():
+    results, failures = JobRunner(processes=1).run(crash, {"a": (1,)})
+    assert failures == {"a": "Process exited with code 3"}
+
+
+def get_pid(x: int) -> int:
+    return os.getpid()
+
+
+def sleep_or_return(x: int) -> int:
+    if x == 0:
+        time.sleep(60)
+    return x
+
+
+def test_workers_are_reused_across_jobs():
+    results, _ = JobRunner(processes=2).run(get_pid, {str(i): (i,) for i in range(20)})
+    assert len(set(results.values())) <= 2
+    assert os.getpid() not in results.values()
+
+
+def test_timed_out_jobs_are_killed_without_stopping_others():
+    started = time.monotonic()
+    results, failures = JobRunner(processes=2, timeout=0.5).run(
+        sleep_or_return, {str(i): (i,) for i in range(4)}
+    )
+    assert time.monotonic() - started < 10
+    assert results == {"1": 1, "2": 2, "3": 3}
+    assert failures == {"0": "Timed out after 0.5s"}
@@ -0,0 +1,98 @@
+import importlib
+import os
+import time
+
+from tester.build.shard import (WorkQueue, merge_shard_outputs, shard_name, start_shard_log,
+                                write_shard_log)
+
+
+def make_queue(tmp_path, count: int = 2) -> WorkQueue:
+    queue = WorkQueue(str(tmp_path / "_queue"))
+    queue.create({f"{i}-of-{count}": {"shard_num": i} for i in range(1, count + 1)})
+    return queue
+
+
+def age_claim(queue: WorkQueue, name: str, seconds: float):
+    past = time.time() - seconds
+    os.utime(os.path.join(queue.claimed_path, name), (past, past))
+
+
+def test_each_task_is_claimed_once(tmp_path):
+    queue = make_queue(tmp_path)
+    first, second = queue.claim(), queue.claim()
+    assert {first[0], second[0]} == {"1-of-2", "2-of-2"}
+    assert queue.claim() is None
+    queue.complete(first[0])
+    assert queue.counts() == (0, 1, 1)
+
+
+def test_claiming_starts_a_fresh_lease(tmp_path):
+    queue = make_queue(tmp_path, 1)
+    past = time.time() - 3600
+    os.utime(os.path.join(queue.pending_path, "1-of-1"), (past, past))
+    name, _ = queue.claim()
+    assert queue.stale_claims(lease=60) == []
+
+
+def test_stale_claims_are_requeued(tmp_path):
+    queue = make_queue(tmp_path)
+    dead, _ = queue.claim()
+    alive, _ = queue.claim()
+    age_claim(queue, dead, 120)
+    assert queue.stale_claims(lease=60) == [dead]
+
+    queue.requeue(dead)
+    assert queue.counts() == (1, 1, 0)
+    assert queue.claim()[0] == dead
+
+
+def test_renewed_claims_stay_valid(tmp_path):
+    queue = make_queue(tmp_path, 1)
+    name, _ = queue.claim()
+    age_claim(queue, name, 120)
+    with queue.keep_claimed(name, lease=0.2):
+        time.sleep(0.2)
+    assert queue.stale_claims(lease=60) == []
+
+
+def test_requeued_task_can_still_be_completed(tmp_path):
+    queue = make_queue(tmp_path, 1)
+    name, _ = queue.claim()
+    queue.requeue(name)
+    queue.complete(name)
+    assert queue.counts() == (0, 0, 1)
+
+
+def test_shards_merge_only_once_all_are_built(config):
+    output_path = os.path.join(config.active_course_path, config.tests_dir_name, "quiz1")
+    os.makedirs(output_path)
+    students = config.get_students()
+    for i, sid in enumerate(sorted(students), start=1):
+        config.save_manifest("quiz1", {sid: {"questions": [i]}}, part=shard_name(i, 2))
+    # Manifest parts are written before rendering, so they don't mean a shard is built
+    assert not merge_shard_outputs(config, output_path, 2)
+
+    write_shard_log(config, output_path, shard_name(1, 2), [(students["1"], "Lovelace_1.pdf")])
+    assert not merge_shard_outputs(config, output_path, 2)
+    write_shard_log(config, output_path, shard_name(2, 2), [(students["2"], "Turing_2.pdf")])
+    assert merge_shard_outputs(config, output_path, 2)
+    assert config.get_manifest("quiz1") == {"1": {"questions": [1]}, "2": {"questions": [2]}}
+
+    # Building a shard again marks it as not built until it writes its log
+    start_shard_log(config, output_path, shard_name(2, 2))
+    assert not merge_shard_outputs(config, output_path, 2)
+
+
+def test_workers_build_shards_with_the_queued_settings(config, monkeypatch):
+    commands = importlib.import_module("tester.build.commands")
+    output_path = os.path.join(config.active_course_path, config.tests_dir_name, "quiz1")
+    task = {"shard_num": 1, "shard_count": 1, "max_question": None, "max_questions": None,
+            "output_format": "html", "jobs": 2, "timeout": 30.0, "retries": 0,
+            "min_free_memory": 64}
+    WorkQueue(os.path.join(output_path, config.queue_dir_name)).create({"1-of-1": task})
+    built = []
+    monkeypatch.setattr(commands, "_build_shard",
+                        lambda config, output_dir_name, **kwargs: built.append(kwargs))
+
+    commands._run_worker(config, "quiz1")
+    assert built == [dict(task, merge=False)]